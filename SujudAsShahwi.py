@@ -1,89 +1,52 @@
 # -*- coding: utf-8 -*-
 
-import re
-import unicodedata
-from collections import defaultdict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from fuzzywuzzy import process
-from flask import Flask, request, jsonify, render_template
-from waitress import serve
+import json
+import threading
+from knowledge_base import KNOWLEDGE_BASE_PATH, KnowledgeBase, load_knowledge_base, reload_knowledge_base
+from normalization import MAX_CACHED_LENGTH, normalize_text
+from result_cache import ResultCache
+from search_cascade import CHEAP_TIERS, Query, SearchCascade
+from metrics import SEARCH_ANSWERS, SEARCH_STAGE_SECONDS
+from timer import TRACER
+from suggest_index import SUGGEST_LIMIT
+
+# scikit-learn, numpy and Flask are imported where they are first needed so the
+# CLI and exact/keyword searches start without loading them (see startup_budget.py)
+
+# How many queries search_many scores per sparse-matrix product
+BATCH_CHUNK_SIZE = 512
+
+# Candidates returned by search_candidates, and the most /search returns for "top_k"
+TOP_K = 5
+MAX_TOP_K = 20
+
+# Default size of the per-helper result cache; 0 disables it
+RESULT_CACHE_SIZE = 1024
+
+# Answer to a query that only the expensive tiers could match while searches are degraded under load
+DEGRADED_MESSAGE = "The service is busy; only exact and keyword matches are available. Please try again shortly."
+
+
+def _answered(path):
+    # Counted for /metrics and recorded as the match tier on the current trace span
+    SEARCH_ANSWERS.inc(path)
+    TRACER.annotate(tier=path)
 
 
 class SujudAsShahwi:
-    def __init__(self):
-        self.corrections = {
-            "missed sujud": "Sit, perform the missed sujud, then do Sujud Ba’Adiyya.",
-            "missed ruku": "Stand up, perform ruku, then do Sujud Ba’Adiyya.",
-            "extra rakaah": "Perform Sujud Ba’Adiyya after completing the prayer.",
-            "doubting rakaat": "Assume the lower number, complete prayer, then do Sujud Qabliyya.",
-        }
+    def __init__(self, cache_size=RESULT_CACHE_SIZE, cache_ttl=None, knowledge_base=None, cascade=None):
+        # Results keyed on the preprocessed query, cleared whenever the knowledge base changes
+        self.cache = ResultCache(maxsize=cache_size, ttl=cache_ttl)
+        self._reload_lock = threading.Lock()
+        # Held while the knowledge base is swapped and while a result is cached, so no stale result survives a swap
+        self._swap_lock = threading.Lock()
         
-        self.keyword_to_mistake = {word: mistake for mistake in self.corrections for words in mistake.split() for word in words.split()}
+        # Search tiers and their thresholds, exact -> keyword -> similarity -> fuzzy unless configured
+        self.cascade = cascade if cascade is not None else SearchCascade.from_env()
         
-        self.keywords = {
-            "sujud": ["sujud", "sajda"],
-            "ruku": ["ruku"],
-            "rakaah": ["rakaah", "rakah", "rakats"],
-            "qabliyya": ["qabliyya"],
-            "baadiyya": ["baadiyya"],
-        }
-        
-        self.vectorizer = TfidfVectorizer()
-    
-        self.rules = {
-            "When to Perform Sujood As-Sahw": {
-                "Before Salam (Qabli)": [
-                    "Forgetting a wajib (necessary act), such as a Rukū or sujūd.",
-                    "Being unsure whether you prayed three or four raka’āt. Assume the lower number and complete the prayer, then perform Sujud Qabla Asalam (Sujud before Salam)."
-                ],
-                "After Salam (Ba’Adiyya)": [
-                    "Praying five raka’āt in a four-raka’āt prayer.",
-                    "Reciting aloud in a prayer that should be silent (e.g., Dhuhr).",
-                    "Making an extra rukū‘ or sujūd."
-                ],
-                "If Both Addition & Omission Occur": [
-                    "If both omit and add something, the omission takes priority, so you do Qabli before salam."
-                ]
-            },
-            "When Sujood As-Sahw Expires": [
-                "If a long time has passed (e.g., you left the mosque), you cannot perform Qabli anymore.",
-                "Ba’Adiyya can still be done, even after a delay.",
-                "If major mistakes accumulate (e.g., multiple pillars are missed), the prayer may become invalid and must be repeated."
-            ],
-            "Following the Imam in Forgetfulness": [
-                "Imam forgets something: Follower says SubhanAllāh.",
-                "Imam rises after 2 raka’āt instead of sitting: If his hands are lifted, stand with him; otherwise, remain sitting.",
-                "Imam adds a raka’ah mistakenly: Only follow if unsure; if certain it’s extra, remain sitting.",
-                "Imam makes salam early: Say SubhanAllāh to signal him; if he corrects, do Ba’Adiyya.",
-                "Imam doubts his prayer: He may ask two trustworthy people, and speaking is allowed.",
-                "Follower joins late: Follow Imam’s Qabli prostration but delay Ba’Adiyya until completing the prayer."
-            ],
-            "Correcting Missed Actions": {
-                "Forgetting Rukū‘ and remembering in Sujūd": "Stand up, recite Qur’an, then bow.",
-                "Forgetting Sujūd and remembering after standing": "Sit, perform Sujūd, then Ba’Adiyya.",
-                "Standing up instead of sitting after 2 raka’āt": "If hands still near ground, return to sitting; otherwise, continue & do Qabli.",
-                "Forgetting Rukū‘ or Sujūd and remembering after a long time": "In obligatory prayer, repeat the whole prayer; in optional prayer, do nothing."
-            },
-            "Forgetfulness in Shaf’ and Witr": [
-                "In Shaf’, if you forget something, prostrate after salām, then perform Witr as usual.",
-                "Speaking between Shaf’ and Witr is disliked but does not require Sujood.",
-                "If you miss a raka’ah with the Imam in Witr, do not prostrate with him unless you caught at least one raka’ah.",
-                "If you forget Qabli, revert to general Sujood rules."
-            ],
-            "More Rules on Forgetfulness": [
-                "If a person sighs but does not speak, nothing is owed. However, speaking intentionally invalidates the prayer.",
-                "If the Imam makes an obvious mistake, a follower may correct him verbally by saying SubhanAllāh.",
-                "If a person misses Sujood As-Sahw but remembers quickly, they can perform it immediately.",
-                "If a mistake occurs in Jama’ah (congregation), someone should step forward to replace the Imam if necessary."
-            ],
-            "Conclusion": [
-                "These rules ensure that minor mistakes do not invalidate the prayer but are corrected in a proper way.",
-                "The rulings are based on the principles of ease and correction in worship.",
-                "As long as a person tries their best, their prayer is accepted by Allah’s mercy.",
-                "All praise belongs to Allah, the Exalted, the Most Apparent, the Most Hidden, the First and the Last."
-            ]
-        } 
+        # Mistakes, corrections, keywords and rules, loaded once per process from data/knowledge_base.json
+        self.knowledge_base = knowledge_base if knowledge_base is not None else load_knowledge_base()
+    
     def display_rules(self):
         """This function properly prints the rules of Sujood As-Sahw."""
         print("\n📜 **Rules of Sujood As-Shahwi:**")
@@ -107,231 +70,149 @@ class SujudAsShahwi:
         """This function returns all the rules of Sujood As-Sahw."""
         return self.rules
 
-    def search_mistake(self, user_input):
-        if not user_input.strip():
-            return "Invalid input. Please enter a prayer mistake."
+    @property
+    def knowledge_base(self):
+        return self._knowledge_base
+
+    @knowledge_base.setter
+    def knowledge_base(self, knowledge_base):
+        """Swapping the knowledge base rebinds every lookup structure and drops cached results."""
+        with self._swap_lock:
+            self._knowledge_base = knowledge_base
+            self.rules = knowledge_base.rules
+            self.keywords = knowledge_base.keywords
+            self.keyword_matcher = knowledge_base.keyword_matcher
+            self.keyword_to_mistake = knowledge_base.token_index
+            self.cache.clear()
+
+    def reload(self, path=KNOWLEDGE_BASE_PATH):
+        """This function re-reads the knowledge base file and publishes it with a single reference swap."""
+        with self._reload_lock:
+            # Built completely off to the side; searches keep using the old snapshot until the swap
+            self.knowledge_base = reload_knowledge_base(self.knowledge_base, path)
+        return self.knowledge_base
+
+    @property
+    def corrections(self):
+        return self.knowledge_base.corrections
+
+    @corrections.setter
+    def corrections(self, corrections):
+        """Assigning a new dict compiles a new knowledge base around it, ranking suggestions as before."""
+        kb = self.knowledge_base
+        self.knowledge_base = KnowledgeBase(corrections, kb.keywords, kb.rules, kb.popularity)
+
+    @property
+    def index(self):
+        """The TF-IDF search index, loaded the first time a query needs similarity scoring."""
+        return self.knowledge_base.index
+
+    def search_mistake(self, user_input, degraded=False):
+        """This function answers one query; degraded runs only the cheap tiers and leaves the rest unanswered."""
+        return self.search_ranked(user_input, 1, degraded)[0]
+
+    def search_ranked(self, user_input, k=TOP_K, degraded=False):
+        """This function returns (result, answering tier or None, up to k (mistake, score) best first) from one cascade pass."""
+        with TRACER.span("search_mistake", query_length=len(user_input) if isinstance(user_input, str) else 0):
+            return self._search_chunk([user_input], CHEAP_TIERS if degraded else None, k)[0]
+
+    @TRACER.traced()
+    def search_many(self, queries):
+        """This function searches a batch of mistakes and returns the results in input order."""
+        return list(self.iter_search_many(queries))
+
+    def iter_search_many(self, queries, chunk_size=BATCH_CHUNK_SIZE):
+        """This function yields one result per query, scoring the queries chunk by chunk to bound memory."""
+        chunk = []
+        for query in queries:
+            chunk.append(query)
+            if len(chunk) >= chunk_size:
+                yield from self._chunk_results(chunk)
+                chunk = []
+        if chunk:
+            yield from self._chunk_results(chunk)
+
+    def _chunk_results(self, chunk):
+        # A stream outlives its request span, so each chunk is sampled as one trace of its own
+        with TRACER.span("search_chunk", queries=len(chunk)):
+            answers = self._search_chunk(chunk)
+        return [result for result, _, _ in answers]
+
+    def _search_chunk(self, queries, only=None, k=1):
+        # Every stage reads the same snapshot, even if a reload swaps it meanwhile
+        kb = self.knowledge_base
+        answers = [None] * len(queries)
+        pending = []
+        for position, user_input in enumerate(queries):
+            if not isinstance(user_input, str) or not user_input.strip():
+                _answered("invalid")
+                answers[position] = ("Invalid input. Please enter a prayer mistake.", None, [])
+                continue
+            with TRACER.span("preprocess_text", SEARCH_STAGE_SECONDS):
+                text = self.preprocess_text(user_input)
+            # Long queries are neither looked up nor kept, so the cache is bounded in bytes as well as entries.
+            # Entries keep the candidates they were ranked with; one ranked for a smaller k is a miss, unless
+            # its ranking came up shorter than its k and so was complete
+            cached = None
+            if len(text) <= MAX_CACHED_LENGTH:
+                cached = self.cache.get(text, lambda entry: k <= entry[3] or len(entry[2]) < entry[3])
+            if cached is not None:
+                _answered("cache")
+                answers[position] = (cached[0], cached[1], cached[2][:k])
+            else:
+                pending.append((position, Query(text)))
+        if not pending:
+            return answers
         
-        user_input = self.preprocess_text(user_input)
-        keywords_in_input = self.extract_keywords(user_input)
-        
-        if not keywords_in_input:
-            return "No relevant keywords found in your input."
-        
-        for keyword in keywords_in_input:
-            if keyword in self.keyword_to_mistake:
-                mistake = self.keyword_to_mistake[keyword]
-                return "Mistake: {}\nCorrection: {}".format(mistake, self.corrections[mistake])
-        
-        best_match = None
-        best_score = 0
-        
-        mistake_texts = list(self.corrections.keys())
-        tfidf_matrix = self.vectorizer.fit_transform(mistake_texts + [user_input])
-        similarity_scores = cosine_similarity(tfidf_matrix[-1], tfidf_matrix[:-1]).flatten()
-        
-        for idx, score in enumerate(similarity_scores):
-            if score > best_score:
-                best_score = score
-                best_match = mistake_texts[idx]
-        
-        if best_match and best_score > 0.3:
-            return "Mistake: {}\nCorrection: {}".format(best_match, self.corrections[best_match])
-        else:
-            return "No specific correction found for this mistake type."
+        # Each query stops at the first tier confident enough to answer it
+        ranked_answers = self.cascade.run([query for _, query in pending], kb, only, k)
+        for (position, query), (tier, ranked) in zip(pending, ranked_answers):
+            if ranked:
+                _answered(tier)
+                mistake = ranked[0][0]
+                result = "Mistake: {}\nCorrection: {}".format(mistake, kb.corrections[mistake])
+            elif only is not None:
+                # The skipped tiers might still answer it, so this is neither final nor cached
+                _answered("degraded")
+                answers[position] = (DEGRADED_MESSAGE, None, [])
+                continue
+            elif not query.categories(kb):
+                _answered("no_keywords")
+                result = "No relevant keywords found in your input."
+            else:
+                _answered("no_match")
+                result = "No specific correction found for this mistake type."
+            answers[position] = (result, tier, ranked)
+            self._remember(kb, query.text, (result, tier, ranked, k))
+        return answers
+
+    def _remember(self, kb, user_input, entry):
+        # A result computed against a snapshot that has since been swapped out must not outlive the cache clear;
+        # checked under the swap lock, so a swap cannot land between the check and the put
+        if len(user_input) > MAX_CACHED_LENGTH:
+            return
+        with self._swap_lock:
+            if kb is self.knowledge_base:
+                self.cache.put(user_input, entry)
 
     def get_correction(self, mistake_type):
-        # General corrections for common mistakes
-        corrections = {
-
-            "missed sujud": "Sit, perform the missed sujud, then do Sujud Ba’Adiyya.",
-            "missed ruku": "Stand up, perform ruku, then do Sujud Ba’Adiyya.",
-            "extra rakaah": "Perform Sujud Ba’Adiyya after completing the prayer.",
-            "doubting rakaat": "Assume the lower number, complete prayer, then do Sujud Qabliyya.",
-            "doubting whether you prayed 3 or 4 raka’āt": "Assume the lowest number i.e 3 and completing the 4th, then do sujud after salam (Sujud Qabliyya).",
-            "adding an extra raka’ah": "Perform sujud before salam (sujud ba'adiyya).",
-            "saying salam before completing the prayer": "Complete what ever you're missing , then perform sujud before salam (Sujud Ba'adiyya).",
-            "missing a rukū‘ and remembering while in sujūd": "Stand up, perform the missed rukū‘, and do sujud before salam (sujud ba'adiyya).",
-            "forgetting a sujūd and remembering after standing": "Sit back down, do the sujūd, and do sujud before salam (sujud ba'adiyya).",
-            "missed 1 sujud": "Sit, perform the missed sujūd, then complete the prayer with Sujud Ba'Adiyya.",
-            "missed a sujud": "Sit, perform the missed sujūd, then complete the prayer with Sujud Ba'Adiyya.",
-            "forget 1 sujud": "Sit, perform the missed sujūd, then complete the prayer with Sujud Ba'Adiyya.",
-            "forgetting sujud": "Sit, perform the missed sujūd, then complete the prayer with Sujud Ba'Adiyya.",
-            "extra rukū‘": "Perform Sujud Ba'Adiyya after completing the prayer.",
-            "added extra raka’ah": "Perform Sujud Ba'Adiyya after completing the prayer.",
-            "unsure about raka’at": "Assume the lower number and complete the prayer, then do Sujud Qabliyya.",
-            "missing rukū‘": "If you remember in sujūd, stand up, perform rukū‘, and then complete the prayer with Sujud Ba'Adiyya.",
-            "forgot to do Sujud or Sajdas": "Perform 2 sajdas after salam (Sujud Qabliyya) after completing your prayer.",
-            "did extra sajdas": "Perform sajda before salam (Sujud Ba'Adiyya) for the extra sajda.",
-            "saying salam too early": "Complete the prayer and perform a sajda after salam (Sujud Qabliyya).",
-            "doubting if I did 2 or 3 sajdas": "Assume the lower number; perform a sajda after salam (Sujud Qabliyya) if necessary.",
-            "forgetting qunūt": "No sajdahs required, but avoid doing it intentionally.",
-            "missing rukū‘": "If remembered in sujūd, return to rukū‘, then perform sajda after salam (sujud qabliyya).",
-            "adding extra raka’ah": "Perform a sajda after salam (sujud qabliyya) after the prayer.",
-            "doubting after making salam": "If far from the masjid, the salāh is invalid.",
-            "forgetting to perform the sajdas after an omission": "Perform 2 sajdas after salam (sujud qabliyya) after completing your prayer.",
-            "adding an extra sajda": "Perform sajda before salam (sujud ba'adiyya) for the extra sajda.",
-            "saying salam before completing prayer": "Complete your prayer, then perform a sajda after salam (sujud qabliyya) for the early salam.",
-            "forgetting a rukū‘ while in sujūd": "Stand up, perform the missed rukū‘, and do sajda after salam (sujud qabliyya).",
-            "forgetting a sujūd after standing": "Sit back down, do the sujūd, and then perform sajda after salam (sujud qabliyya).",
-            "forgetting to recite silently after speaking": "Do a sajda after salam (sujud qabliyya) since it’s a forgetfulness.",
-            "forgetting a sunnah act more than three times": "Your obligatory prayer becomes invalid.",
-            "forgetting to recite a Surah in the last two raka’āt": "You do not owe anything.",
-            "laughing during prayer": "Laughter invalidates the prayer; restart your prayer.",
-            "unsure if in Witr": "Consider it the second raka’ah of Shaf‘ and prostrate after salam (sujud qabliyya).",
-            "forgetting to recite Fātiḥa": "Repeat Fātiḥa and perform a sajda after salam (sujud qabliyya) for forgetfulness.",
-            "accidentally adding extra raka’āt": "Perform a sajda after salam (sujud qabliyya) after completing the prayer.",
-            "not catching a raka’ah": "If you do not catch a raka’ah, you cannot prostrate with the Imam, and your salāh becomes invalid.",
-            "forgetting to perform sujud after catching a raka’ah": "You revert back to the basic rules of prostrations of forgetfulness and perform a sujud after salam (sujud qabliyya).",
-            "owing both sujuds": "If you owe both sujud qabliyya and sujud ba'adiyya, a sujud qabliyya suffices; just prostrate before salam.",
-            "forgetting a rukū‘ and remembering in sujūd": "Return to standing, recite a bit of Qur’ān, and proceed to bow.",
-            "remembering a sajdah after standing": "If you haven't sat yet, return to sitting and perform a sujud after salam (sujud qabliyya).",
-            "remembering a rukū‘ after rising": "Proceed with your salāh and add a raka’ah later, prostrating after salam (sujud qabliyya).",
-            "invalidating salāh due to mistakes": "Repeat the whole prayer if multiple mistakes occur; if unsure, proceed with the prayer."
-            "missed 1 sujud': 'You should sit, perform the missed sujud, then do Ba’Adiyya.",
-            
-            # Intention (Niyyah)
-            "forgot to make intention": "Your Salah is invalid; you must restart with the correct intention.",
-            "made intention for wrong prayer": "If you realize before Takbir, change your intention. If after, restart the prayer.",
-            "doubt in intention after starting": "If strong doubt arises, restart the prayer; otherwise, continue.",
-            
-            # Takbir (Allahu Akbar)
-            "forgot to say Takbiratul Ihram": "Your prayer has not started; restart the Salah properly.",
-            "mispronounced Takbir": "If unintentional, continue; if intentional and changes meaning, restart.",
-            "delayed Takbir": "Takbir must precede movements; if delayed significantly, restart Salah.",
-            
-            # Surah Al-Fatiha
-            "forgot to recite Al-Fatiha": "Recite it immediately if still in the same raka'ah. If remembered after Ruku’, restart the Salah.",
-            "mispronounced Al-Fatiha": "If it changes meaning, restart Salah; if minor, continue.",
-            "revert cannot recite Al-Fatiha": "Recite what you can, read from a book, or say 'SubhanAllah' in place.",
-            "forgot a verse in Al-Fatiha": "Recite the missing verse if in the same raka'ah; if skipped completely, restart Salah.",
-            "recited Fatiha incorrectly but realized later": "If meaning is changed, redo the prayer; otherwise, continue.",
-            
-            # Surah after Al-Fatiha
-            "forgot to recite a Surah after Al-Fatiha": "It is Sunnah; no need for Sujud Sahw.",
-            "recited Surah before Al-Fatiha": "Prayer is invalid; restart the Salah.",
-            "skipped Surah in first raka'ah but recited in second": "No Sujud Sahw required, continue prayer.",
-            
-            # Ruku' (Bowing)
-            "missed Ruku' and remembered in Sujood": "Stand up, perform Ruku', and redo Sujood, then do Sujud Sahw.",
-            "did extra Ruku'": "Perform Sujud Ba'Adiyya after completing the prayer.",
-            
-            # Sujood (Prostration)
-            "missed one Sujood": "Sit and perform the missed Sujood, then do Sujud Ba'Adiyya.",
-            "missed both Sujoods": "Prayer is invalid; restart Salah.",
-            "did extra Sujood": "Perform Sujud Ba'Adiyya after completing the prayer.",
-            
-            # Tashahhud (Sitting)
-            "forgot Tashahhud in the middle": "No need for Sujud Sahw; continue prayer.",
-            "forgot final Tashahhud": "Prayer is incomplete; if not much time has passed, return and complete it, then do Sujud Sahw.",
-            
-            # Salam (Ending the Prayer)
-            "said Salam before completing the prayer": "Complete the prayer and do Sujud Ba'Adiyya.",
-            "forgot to say Salam": "Your Salah is incomplete; say Salam immediately.",
-            
-            # Doubt in Raka'at
-            "doubting whether prayed 3 or 4 raka’āt": "Assume the lower number and complete the prayer, then do Sujud Sahw.",
-            "added an extra raka’ah": "Perform Sujud Ba'Adiyya after completing the prayer.",
-            "unsure about the number of Sajdah": "Assume the lower number and perform Sujud Sahw.",
-            
-            # Other Mistakes
-            "laughed during prayer": "Salah is invalid; restart.",
-            "spoke unintentionally": "Continue Salah, no Sujud Sahw required unless it was a full sentence.",
-            "spoke intentionally": "Salah is invalid; restart.",
-            "ate or drank during prayer": "Prayer is invalid; restart.",
-            "prayed in the wrong direction (Qibla)": "If realized during Salah, correct immediately. If after, Salah is valid if mistaken unintentionally.",
-            "performed prayer with unclean clothes": "Salah is invalid; redo it after purification.",
-            
-            # Witr & Special Prayers
-            "forgot Qunoot in Witr": "No Sujud Sahw required.",
-            "unsure if in Witr or another prayer": "Continue Salah and perform Sujud Sahw.",
-            
-            # Catching Up with Imam
-            "missed first raka'ah with the Imam": "Join and make up for missed raka'ah after the Imam’s Salam.",
-            "missed entire Ruku' with the Imam": "Raka'ah is not counted; you must add one after the Imam finishes.",
-            
-            # Sujud Shahwi (Forgetfulness Prostration)
-            "missed Sujud Shahwi": "If time hasn’t passed, perform it immediately. If too late, no need to redo Salah.",
-            "owing both Sujud Qabliyyah and Ba'Adiyya": "Perform only Sujud Qabliyyah before Salam."
-
-
-
-        
-        }
-       
-             
-        
+        """This function returns the correction for a known mistake, or None if it is not in the knowledge base."""
+        kb = self.knowledge_base
+        mistake = kb.lookup(mistake_type)
+        if mistake is None:
+            return None
+        return kb.corrections[mistake]
     
-        self.keyword_to_mistake = {word: mistake for mistake in self.corrections for words in mistake.split() for word in words.split()}
-        
-        
-        self.keywords = {
-            "sujud": ["sujud", "sajda"],
-            "ruku": ["ruku"],
-            "rakaah": ["rakaah", "rakah", "rakats"],
-            "qabliyya": ["qabliyya"],
-            "baadiyya": ["baadiyya"],
-        }
-        
-        self.vectorizer = TfidfVectorizer()
-        
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """This function returns up to `limit` mistakes and keywords completing the prefix, most popular first."""
+        return list(self.knowledge_base.suggest_index.suggest(prefix, limit))
     
     def preprocess_text(self, text):
-        # Add your text preprocessing logic here
-        return text.strip().lower()
+        # Same folding the knowledge base applies to its keys, so exact lookups and cache keys line up
+        return normalize_text(text)
 
     def extract_keywords(self, text):
-        matched_keywords = set()
-        for category, words in self.keywords.items():
-            for word in words:
-                if word in text:
-                    matched_keywords.add(category)
-        return list(matched_keywords)
-
-def preprocess_text(self, text):
-        text = text.lower()
-        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('utf-8')
-        text = re.sub(r'[^a-zA-Z0-9 ]', '', text)
-        return text
-    
-def extract_keywords(self, text):
-        matched_keywords = set()
-        for category, words in self.keywords.items():
-            for word in words:
-                if word in text:
-                    matched_keywords.add(category)
-        return list(matched_keywords)
-    
-def search_mistake(self, user_input):
-        if not user_input.strip():
-            return "Invalid input. Please enter a prayer mistake."
-        
-        user_input = self.preprocess_text(user_input)
-        keywords_in_input = self.extract_keywords(user_input)
-        
-        if not keywords_in_input:
-            return "No relevant keywords found in your input."
-        
-        for keyword in keywords_in_input:
-            if keyword in self.keyword_to_mistake:
-                mistake = self.keyword_to_mistake[keyword]
-                return "Mistake: {}\nCorrection: {}".format(mistake, self.corrections[mistake])
-        
-        best_match = None
-        best_score = 0
-        
-        mistake_texts = list(self.corrections.keys())
-        tfidf_matrix = self.vectorizer.fit_transform(mistake_texts + [user_input])
-        similarity_scores = cosine_similarity(tfidf_matrix[-1], tfidf_matrix[:-1]).flatten()
-        
-        for idx, score in enumerate(similarity_scores):
-            if score > best_score:
-                best_score = score
-                best_match = mistake_texts[idx]
-        
-        if best_match and best_score > 0.3:
-            return "Mistake: {}\nCorrection: {}".format(best_match, self.corrections[best_match])
-        else:
-            return "No specific correction found for this mistake type."
+        return self.keyword_matcher.categories(text)
 
 """def main_menu():
     sujood = SujudAsShahwi()
@@ -374,37 +255,315 @@ if __name__ == "__main__":
     main_menu() """
 
 
-# Initialize Flask
-app = Flask(__name__)  
-app.config['DEBUG'] = True
-app.config['TEMPLATES_AUTO_RELOAD'] = False  # Disable auto-reload for templates
-sujood_helper = SujudAsShahwi()  # Initialize helper
-
-# Home Page
-@app.route('/')
-def home():
-    return render_template("index.html")
-
-# View Rules
-@app.route('/rules')
-def rules():
-    return jsonify(sujood_helper.rules)
-
-# Search for a mistake
-@app.route('/search', methods=['POST'])
-def search():
-    data = request.get_json()
-    user_input = data.get("mistake", "")
-    result = sujood_helper.search_mistake(user_input)
-    return jsonify({"correction": result})
+def read_top_k(data):
+    """This function returns the "top_k" a /search body asks for, capped at MAX_TOP_K, or None."""
+    top_k = data.get("top_k") if isinstance(data, dict) else None
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k <= 0:
+        return None
+    return min(top_k, MAX_TOP_K)
+
+
+def search_payload(answer, top_k=None, degraded=False):
+    """This function builds the /search response body from a search_ranked answer."""
+    result, tier, candidates = answer
+    payload = {"correction": result}
+    if top_k is not None:
+        # Ranked alternatives from the tier that answered, with their scores
+        payload["tier"] = tier
+        payload["candidates"] = [{"mistake": mistake, "score": score} for mistake, score in candidates]
+    if degraded:
+        payload["degraded"] = True
+    return payload
+
+
+def _ndjson_items(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            # Parsed while the response streams, so a bad line becomes an error result instead of aborting it
+            yield ValueError("Invalid JSON on line {}: {}".format(number, e))
+
+
+def read_batch_queries(req):
+    """This function reads batch queries from a JSON body {"mistakes": [...]} or lazily from an NDJSON body.
+
+    A malformed NDJSON line is yielded as a ValueError in its place; a JSON body that is not an object
+    with a "mistakes" list raises ValueError.
+    """
+    if req.mimetype == "application/x-ndjson":
+        items = _ndjson_items(req.stream)
+    else:
+        data = req.get_json(silent=True)
+        items = data.get("mistakes") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise ValueError('Request body must be a JSON object {"mistakes": [...]} or NDJSON.')
+    # Each item is either a plain string or {"mistake": "..."}
+    return (item.get("mistake", "") if isinstance(item, dict) else item for item in items)
+
+
+def stream_batch_results(helper, queries):
+    """This function streams one NDJSON line per query so large batches never sit in memory."""
+    from flask import Response, stream_with_context
+    
+    errors = {}
+
+    def searchable():
+        for position, query in enumerate(queries):
+            if isinstance(query, ValueError):
+                errors[position] = str(query)
+                query = None
+            yield query
+
+    def generate():
+        for position, result in enumerate(helper.iter_search_many(searchable())):
+            error = errors.pop(position, None)
+            line = {"index": position, "error": error} if error is not None else {"index": position, "correction": result}
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+# Suggestions only change with the corpus, so browsers and proxies may reuse them
+SUGGEST_CACHE_CONTROL = "public, max-age=300"
+SUGGEST_MAX_LIMIT = 20
+SUGGEST_MAX_PREFIX = 64
+
+
+def create_app(helper=None, debug=True, threads=None):
+    """This function builds the Flask app around a helper, importing Flask only when a web server is wanted.
+
+    `threads` is the server's request threads per process, used to size admission control for the search routes.
+    """
+    import hmac
+    import os
+    import time
+    from flask import Flask, Response, abort, g, request, jsonify, render_template
+    from markupsafe import Markup
+    import metrics
+    from rules_payload import RulesPayload
+    from knowledge_base import KnowledgeBaseWatcher
+    from admission import AdmissionController, Overloaded
+    from assets import AssetFiles, read_asset
+    
+    # Initialize Flask
+    app = Flask(__name__)  
+    app.config['DEBUG'] = debug
+    app.config['TEMPLATES_AUTO_RELOAD'] = False  # Disable auto-reload for templates
+    sujood_helper = helper if helper is not None else SujudAsShahwi()  # Initialize helper
+    app.extensions['sujood_helper'] = sujood_helper
+    
+    # Reload the knowledge base when its file changes; every worker polls on its own
+    watch_interval = float(os.environ.get("SUJUD_WATCH_INTERVAL", 0))
+    watcher = None
+    if watch_interval > 0:
+        watcher = KnowledgeBaseWatcher(KNOWLEDGE_BASE_PATH, sujood_helper.reload, watch_interval)
+        app.extensions['knowledge_base_watcher'] = watcher
+    
+    # Bounded concurrency and wait queue for /search and /search/batch, leaving threads free for everything else
+    admission = AdmissionController.for_threads(threads or int(os.environ.get("SUJUD_THREADS", 4)))
+    app.extensions['search_admission'] = admission
+    
+    # Per-route latency for /metrics, and the outermost span of a sampled trace
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.request_span = TRACER.span('http_request', method=request.method, path=request.path).__enter__()
+        if watcher is not None:
+            watcher.ensure_running()
+    
+    @app.after_request
+    def record_latency(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, route, request.method, str(response.status_code))
+        span = g.get('request_span')
+        if span is not None:
+            span.set('status', response.status_code)
+        return response
+    
+    @app.teardown_request
+    def end_trace(exc):
+        # Runs even when the view raised, so the trace context never leaks into the next request
+        span = g.pop('request_span', None)
+        if span is not None:
+            span.__exit__(None, None, None)
+    
+    def admin_error():
+        token = os.environ.get("SUJUD_ADMIN_TOKEN")
+        if not token:
+            return jsonify({"error": "Admin endpoints are disabled"}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+            return jsonify({"error": "Invalid admin token"}), 403
+        return None
+    
+    # Result cache counters, read at scrape time
+    cache_gauges = [
+        metrics.Gauge('sujud_result_cache_' + key, 'Result cache {}.'.format(key.replace('_', ' ')),
+                      lambda key=key: sujood_helper.cache.stats()[key])
+        for key in ('size', 'hits', 'misses', 'evictions', 'expirations')
+    ] + [
+        metrics.Gauge('sujud_search_' + key, 'Searches {}.'.format(key), lambda key=key: getattr(admission, key))
+        for key in ('active', 'waiting')
+    ]
+    
+    # Hashed, precompressed copies of static/ from `python cli.py assets`, used once they are built
+    assets = AssetFiles()
+    if assets:
+        @app.url_defaults
+        def hashed_static_url(endpoint, values):
+            if endpoint == 'static' and 'filename' in values:
+                values['filename'] = assets.url_filename(values['filename'])
+        
+        @app.route('/static/dist/<path:filename>')
+        def built_asset(filename):
+            response = assets.response(filename, request)
+            if response is None:
+                abort(404)
+            return response
+    
+    # Optionally put the stylesheet and the rendered rules in the page itself, saving two round-trips
+    inline_assets = os.environ.get("SUJUD_INLINE_ASSETS", "") not in ("", "0")
+    inline_css = Markup(read_asset('css/styles.css')) if inline_assets else None
+    
+    # Rules are serialized and compressed once, and again only if the knowledge base is swapped
+    rules_payload = RulesPayload(sujood_helper.rules)
+    
+    def current_rules_payload():
+        nonlocal rules_payload
+        if rules_payload.rules is not sujood_helper.rules:
+            rules_payload = RulesPayload(sujood_helper.rules)
+        return rules_payload
+    
+    # Home Page
+    @app.route('/')
+    def home():
+        if not inline_assets:
+            return render_template("index.html")
+        rules_html = Markup(current_rules_payload().html.variants['identity'].decode('utf-8'))
+        return render_template("index.html", inline_css=inline_css, rules_html=rules_html)
+    
+    # View Rules
+    @app.route('/rules')
+    def rules():
+        return current_rules_payload().json.response(request)
+    
+    # View Rules, pre-rendered as the HTML fragment the frontend shows
+    @app.route('/rules/html')
+    def rules_html():
+        return current_rules_payload().html.response(request)
+    
+    def overloaded(e):
+        response = jsonify({"error": "Too many searches in progress ({}), please retry.".format(e.reason)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    
+    # Search for a mistake
+    @app.route('/search', methods=['POST'])
+    def search():
+        data = request.get_json()
+        user_input = data.get("mistake", "")
+        top_k = read_top_k(data)
+        try:
+            with admission.admit() as degraded:
+                answer = sujood_helper.search_ranked(user_input, top_k or 1, degraded)
+        except Overloaded as e:
+            return overloaded(e)
+        return jsonify(search_payload(answer, top_k, degraded))
+    
+    # Completions for search-as-you-type
+    @app.route('/suggest')
+    def suggest():
+        prefix = request.args.get('q', '')[:SUGGEST_MAX_PREFIX]
+        limit = min(request.args.get('limit', SUGGEST_LIMIT, type=int), SUGGEST_MAX_LIMIT)
+        response = jsonify(sujood_helper.suggest(prefix, limit))
+        response.headers['Cache-Control'] = SUGGEST_CACHE_CONTROL
+        return response
+    
+    # Search for many mistakes at once, streamed back as NDJSON in input order
+    @app.route('/search/batch', methods=['POST'])
+    def search_batch():
+        try:
+            queries = read_batch_queries(request)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            admission.acquire()
+        except Overloaded as e:
+            return overloaded(e)
+        # The slot is held while the results stream, and released once the server closes the response
+        try:
+            response = stream_batch_results(sujood_helper, queries)
+        except BaseException:
+            admission.release()
+            raise
+        response.call_on_close(admission.release)
+        return response
+    
+    # Reload the knowledge base on demand; only the worker that receives the request reloads
+    @app.route('/admin/reload', methods=['POST'])
+    def admin_reload():
+        error = admin_error()
+        if error is not None:
+            return error
+        try:
+            knowledge_base = sujood_helper.reload()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            return jsonify({"error": "Reload failed: {}".format(e)}), 400
+        return jsonify({"mistakes": len(knowledge_base.corrections)})
+    
+    # Sampled traces of this worker as Chrome trace-event JSON; ?min_ms= keeps only slow ones
+    @app.route('/admin/trace')
+    def admin_trace():
+        error = admin_error()
+        if error is not None:
+            return error
+        return jsonify(TRACER.chrome_trace(request.args.get('min_ms', 0.0, type=float)))
+    
+    # Result cache counters, for sizing the cache
+    @app.route('/cache/stats')
+    def cache_stats():
+        return jsonify(sujood_helper.cache.stats())
+    
+    # How often each search tier answers and what it costs
+    @app.route('/search/tiers')
+    def search_tiers():
+        return jsonify(sujood_helper.cascade.stats())
+    
+    # Running and queued searches against their limits
+    @app.route('/search/admission')
+    def search_admission():
+        return jsonify(admission.stats())
+    
+    # Counters and latency histograms in the Prometheus text format
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(cache_gauges), mimetype='text/plain; version=0.0.4')
+    
+    @app.route('/healthz')
+    def health_check():
+        return 'Healthy', 200
+    
+    metrics.mark_ready()
+    return app
 
-@app.route('/healthz')
-def health_check():
-    return 'Healthy', 200
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)  # Disable the use of the reloader` 
+_app = None
 
 
+def __getattr__(name):
+    # `app` and `sujood_helper` are created on first access so importing this module stays cheap
+    global _app
+    if name in ("app", "sujood_helper"):
+        if _app is None:
+            _app = create_app()
+        return _app if name == "app" else _app.extensions['sujood_helper']
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
+if __name__ == "__main__":
+    create_app().run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)  # Disable the use of the reloader` 
@@ -5,7 +5,7 @@ a = Analysis(
     ['SujudAsShawi.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('data/knowledge_base.json', 'data')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
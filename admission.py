@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Admission control for the search endpoints.
+
+At most `max_concurrent` searches run at once; up to `max_queue` more wait for a
+slot, each for at most `queue_timeout` seconds; anything beyond that is turned
+away at once with `Overloaded`, which the app answers with 503 and Retry-After.
+Keeping concurrent plus queued searches below the server's thread count leaves
+threads free for /healthz and the other routes however busy search gets.
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import SEARCH_ADMISSIONS
+
+# Seconds a search may wait for a slot before it is rejected
+QUEUE_TIMEOUT = 0.5
+
+
+class Overloaded(Exception):
+    """Raised when a search is not admitted; retry_after is a whole number of seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Thread-safe concurrency limit with a bounded, deadline-limited wait queue."""
+
+    def __init__(self, max_concurrent, max_queue=0, queue_timeout=QUEUE_TIMEOUT, degrade=False,
+                 clock=time.monotonic):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.degrade = degrade
+        self.retry_after = max(1, math.ceil(queue_timeout))
+        self._clock = clock
+        self._slots = threading.Condition(threading.Lock())
+        self.active = 0
+        self.waiting = 0
+
+    @classmethod
+    def for_threads(cls, threads):
+        """This function sizes a controller for a server with `threads` request threads, keeping one free.
+
+        SUJUD_SEARCH_CONCURRENCY, SUJUD_SEARCH_QUEUE, SUJUD_SEARCH_QUEUE_TIMEOUT and
+        SUJUD_DEGRADE_UNDER_LOAD override the defaults.
+        """
+        max_concurrent = int(os.environ.get("SUJUD_SEARCH_CONCURRENCY", max(1, threads // 2)))
+        max_queue = int(os.environ.get("SUJUD_SEARCH_QUEUE", max(0, threads - max_concurrent - 1)))
+        queue_timeout = float(os.environ.get("SUJUD_SEARCH_QUEUE_TIMEOUT", QUEUE_TIMEOUT))
+        degrade = os.environ.get("SUJUD_DEGRADE_UNDER_LOAD", "") not in ("", "0")
+        return cls(max_concurrent, max_queue, queue_timeout, degrade)
+
+    def acquire(self):
+        """This function takes a slot, waiting in the queue if needed, or raises Overloaded."""
+        with self._slots:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                SEARCH_ADMISSIONS.inc("admitted")
+                return
+            if self.waiting >= self.max_queue:
+                SEARCH_ADMISSIONS.inc("rejected")
+                raise Overloaded("queue full", self.retry_after)
+
+            self.waiting += 1
+            deadline = self._clock() + self.queue_timeout
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        SEARCH_ADMISSIONS.inc("timed_out")
+                        raise Overloaded("timed out waiting for a slot", self.retry_after)
+                    self._slots.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            SEARCH_ADMISSIONS.inc("queued")
+
+    def release(self):
+        with self._slots:
+            self.active -= 1
+            self._slots.notify()
+
+    def under_pressure(self):
+        """This function tells whether searches are queued behind the running ones."""
+        return self.waiting > 0
+
+    @contextmanager
+    def admit(self):
+        """This function holds a slot for the block and yields whether the search should degrade to cheap tiers."""
+        self.acquire()
+        try:
+            degraded = self.degrade and self.under_pressure()
+            if degraded:
+                SEARCH_ADMISSIONS.inc("degraded")
+            yield degraded
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "degrade": self.degrade,
+        }
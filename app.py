@@ -1,25 +1,15 @@
-from flask import Flask, request, jsonify, render_template
-from sujud_as_shahwi import SujudAsShahwi
-from waitress import serve
+import serve
+from SujudAsShahwi import SujudAsShahwi, create_app
 
 
-app = Flask(__name__)
+# Same routes as SujudAsShahwi.py, with the helper built at import so a
+# pre-forking server shares it between workers
 sujood_helper = SujudAsShahwi()
-
-@app.route('/')
-def home():
-    return render_template("index.html")
-
-@app.route('/rules')
-def rules():
-    return jsonify({"rules": sujood_helper.view_all_rules()})
-
-@app.route('/search', methods=['POST'])
-def search():
-    data = request.get_json()
-    user_input = data.get("mistake", "")
-    result = sujood_helper.search_mistake(user_input)
-    return jsonify({"correction": result})
+# Admission control is sized for --threads when run as a script; imported by a server, there are no
+# options to read and SUJUD_THREADS sizes it, as it does --threads
+options = serve.parse_args(None if __name__ == "__main__" else [])
+app = create_app(sujood_helper, debug=False, threads=options.threads)
 
 if __name__ == "__main__":
-    serve(app, host="0.0.0.0", port=5000, debug=True, use_reloader=False)
+    serve.warm_up(sujood_helper)
+    serve.main(app=app)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Fingerprinted, precompressed static assets.
+
+    python cli.py assets
+
+copies every file under static/ to static/dist/ with a content hash in its
+name, next to .gz and (with brotli installed) .br variants, and writes
+static/dist/manifest.json mapping each source name to its hashed name. When
+the manifest exists, `url_for('static', filename=...)` resolves to the hashed
+file, which is served in the encoding the client accepts and cached for a
+year as immutable. Without a build, plain Flask static handling is used.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from rules_payload import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+BUILD_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_NAME = "manifest.json"
+
+# Hashed names change with their content, so a copy can be kept for as long as browsers allow
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Hex digits of the content hash kept in file names
+HASH_LENGTH = 12
+# Variants smaller than this fraction of the original are worth keeping
+MIN_COMPRESSION_RATIO = 0.9
+# Suffixes of the precompressed variants, by content coding, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _hashed_name(name, body):
+    stem, extension = os.path.splitext(name)
+    return "{}.{}{}".format(stem, hashlib.sha256(body).hexdigest()[:HASH_LENGTH], extension)
+
+
+def _compressed(body):
+    variants = {".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(body, quality=11)
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(body) * MIN_COMPRESSION_RATIO}
+
+
+def _write(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(body)
+    os.replace(temporary, path)
+
+
+def build_assets(static_dir=STATIC_DIR, build_dir=BUILD_DIR):
+    """This function writes the hashed and precompressed copies and the manifest, and returns the manifest.
+
+    Files from earlier builds are left in place so pages rendered before a deploy keep loading.
+    """
+    manifest = {}
+    for root, directories, files in os.walk(static_dir):
+        directories[:] = sorted(d for d in directories if os.path.join(root, d) != build_dir)
+        for file_name in sorted(files):
+            source = os.path.join(root, file_name)
+            name = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                body = f.read()
+            hashed = _hashed_name(name, body)
+            target = os.path.join(build_dir, *hashed.split("/"))
+            _write(target, body)
+            for suffix, data in _compressed(body).items():
+                _write(target + suffix, data)
+            manifest[name] = hashed
+    _write(os.path.join(build_dir, MANIFEST_NAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+def load_manifest(build_dir=BUILD_DIR):
+    """This function returns the manifest of the last build, or {} if assets were never built."""
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_asset(name, static_dir=STATIC_DIR):
+    """This function returns the source text of a static file, for inlining into a page."""
+    with open(os.path.join(static_dir, *name.split("/")), encoding="utf-8") as f:
+        return f.read()
+
+
+class AssetFiles:
+    """The built assets: their hashed names, and the precompressed variants present for each."""
+
+    def __init__(self, build_dir=BUILD_DIR):
+        self.build_dir = build_dir
+        self.manifest = load_manifest(build_dir)
+        self.variants = {}  # hashed name -> {content coding: suffix}
+        for hashed in self.manifest.values():
+            path = os.path.join(build_dir, *hashed.split("/"))
+            self.variants[hashed] = {encoding: suffix for encoding, suffix in ENCODINGS
+                                     if os.path.exists(path + suffix)}
+
+    def __bool__(self):
+        return bool(self.manifest)
+
+    def url_filename(self, name):
+        """This function returns the filename under static/ that url_for should point at for name."""
+        hashed = self.manifest.get(name)
+        return name if hashed is None else "dist/" + hashed
+
+    def response(self, hashed, req):
+        """This function sends a built asset in the best encoding the request accepts, or None if unknown."""
+        from flask import send_file
+
+        variants = self.variants.get(hashed)
+        if variants is None:
+            return None
+        path = os.path.join(self.build_dir, *hashed.split("/"))
+        accepted = accepted_encodings(req.headers.get("Accept-Encoding"))
+        encoding = next((encoding for encoding in variants if encoding in accepted or "*" in accepted), None)
+        mimetype = mimetypes.guess_type(hashed)[0] or "application/octet-stream"
+        response = send_file(path + variants[encoding] if encoding else path, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = ASSET_CACHE_CONTROL
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
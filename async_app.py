@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import QUEUE_TIMEOUT, Overloaded
+from metrics import SEARCH_ADMISSIONS
+from SujudAsShahwi import read_top_k, search_payload
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one computation."""
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key, start):
+        """This function awaits the in-flight call for key, or starts one with start() if there is none."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(start())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._calls.pop(key, None))
+        # Shielded so one cancelled client does not cancel the work others are waiting on
+        return await asyncio.shield(future)
+
+
+class AsyncSearchApp:
+    """ASGI app answering /search from a bounded thread pool, with identical in-flight queries coalesced.
+
+    Paths other than /search, /search/stats and /healthz go to `fallback`, an optional ASGI app.
+    Up to `max_queue` searches wait for a worker, each for at most `queue_timeout` seconds; more
+    are rejected with 503. With `degrade`, searches run while others wait skip the expensive tiers.
+    """
+
+    def __init__(self, helper, max_workers=4, fallback=None, max_queue=None, queue_timeout=QUEUE_TIMEOUT,
+                 degrade=False):
+        self.helper = helper
+        self.max_workers = max_workers
+        self.fallback = fallback
+        self.max_queue = max_workers * 4 if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = max(1, math.ceil(queue_timeout))
+        self.degrade = degrade
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self.flights = SingleFlight()
+        self.queue_depth = 0  # searches waiting for or running in the executor
+        self._slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path, method = scope["path"], scope["method"]
+        if path == "/search" and method == "POST":
+            try:
+                data = json.loads(await _read_body(receive) or b"{}")
+            except ValueError:
+                await _send_json(send, 400, {"error": "Request body must be JSON."})
+                return
+            top_k = read_top_k(data)
+            try:
+                answer, degraded = await self.search(data.get("mistake", "") if isinstance(data, dict) else "", top_k)
+            except Overloaded as e:
+                await _send_json(send, 503, {"error": "Too many searches in progress ({}), please retry.".format(
+                    e.reason)}, [(b"retry-after", str(e.retry_after).encode())])
+                return
+            await _send_json(send, 200, search_payload(answer, top_k, degraded))
+        elif path == "/search/stats":
+            await _send_json(send, 200, self.stats())
+        elif path == "/healthz":
+            await _send(send, 200, b"Healthy", b"text/plain; charset=utf-8")
+        elif self.fallback is not None:
+            await self.fallback(scope, receive, send)
+        else:
+            await _send_json(send, 404, {"error": "Not found."})
+
+    async def search(self, user_input, top_k=None):
+        """This function returns (search_ranked answer, whether it was degraded), sharing identical in-flight searches."""
+        key = (self.helper.preprocess_text(user_input) if isinstance(user_input, str) else "", top_k)
+        return await self.flights.do(key, lambda: self._run(user_input, top_k))
+
+    async def _run(self, user_input, top_k=None):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if self.queue_depth >= self.max_workers + self.max_queue:
+            SEARCH_ADMISSIONS.inc("rejected")
+            raise Overloaded("queue full", self.retry_after)
+        self.queue_depth += 1
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                SEARCH_ADMISSIONS.inc("timed_out")
+                raise Overloaded("timed out waiting for a slot", self.retry_after)
+            try:
+                degraded = self.degrade and self.queue_depth > self.max_workers
+                SEARCH_ADMISSIONS.inc("degraded" if degraded else "admitted")
+                loop = asyncio.get_running_loop()
+                answer = await loop.run_in_executor(
+                    self.executor, self.helper.search_ranked, user_input, top_k or 1, degraded)
+                return answer, degraded
+            finally:
+                self._slots.release()
+        finally:
+            self.queue_depth -= 1
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": len(self.flights),
+            "coalesced": self.flights.coalesced,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+        }
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send(send, status, body, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await _send(send, status, body, b"application/json", headers)
@@ -0,0 +1,295 @@
+"""Benchmarks for the search pipeline and the HTTP endpoints.
+
+    python benchmark.py                                  # pipeline stages, startup
+    python benchmark.py --load --concurrency 16          # plus a Flask test-client load test
+    python benchmark.py --output bench-1.2.json          # write results as JSON to compare releases
+    python benchmark.py --accuracy                       # only the answer-quality checks
+
+The synthetic query corpus is generated from the knowledge base with a fixed
+seed, so two runs on the same release see exactly the same queries.
+"""
+
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import startup_budget
+from knowledge_base import load_knowledge_base
+from SujudAsShahwi import SujudAsShahwi, create_app
+from search_cascade import SIMILARITY_THRESHOLD, Query, SimilarityTier
+
+KINDS = ("exact", "keyword", "fuzzy", "miss")
+
+# Queries with a known right answer, including ones earlier rankings got wrong: (query, expected mistake)
+KNOWN_ANSWERS = [
+    ("forgot ruku", "missed ruku"),
+    ("rukoo forgot", "missed ruku"),
+    ("I forgot ruku in the second rakah", "missed ruku"),
+    ("I forgot a sajda", "missed sujud"),
+    ("I forgot a sajdah in asr", "missed sujud"),
+    ("did an extra sujud", "did extra sajdas"),
+    ("added a ruku", "extra rukū‘"),
+    ("forgot qunoot in witr", "forgot Qunoot in Witr"),
+    ("dubting rakaat", "doubting rakaat"),
+    ("doubtng rakat", "doubting rakaat"),
+    ("ading extra rakah", "adding extra raka’ah"),
+]
+
+MISS_WORDS = ["weather", "football", "recipe", "train", "holiday", "garden", "computer", "music", "river", "market"]
+
+
+def make_queries(count, seed=42):
+    """This function returns [(kind, query)] with the four kinds in equal parts."""
+    rng = random.Random(seed)
+    kb = load_knowledge_base()
+    mistakes = list(kb.corrections)
+    synonyms = [word for words in kb.keywords.values() for word in words]
+
+    queries = []
+    for i in range(count):
+        kind = KINDS[i % len(KINDS)]
+        if kind == "exact":
+            query = rng.choice(mistakes)
+            query = query.upper() if rng.random() < 0.3 else query
+        elif kind == "keyword":
+            query = "I think I {} a {} in {}".format(
+                rng.choice(["forgot", "missed", "added", "doubted"]), rng.choice(synonyms), rng.choice(["dhuhr", "asr", "isha"]))
+        elif kind == "fuzzy":
+            query = _typo(rng, rng.choice(mistakes))
+        else:
+            query = " ".join(rng.sample(MISS_WORDS, 3))
+        queries.append((kind, query))
+    return queries
+
+
+def _typo(rng, text):
+    chars = list(text)
+    for _ in range(max(1, len(chars) // 12)):
+        i = rng.randrange(len(chars))
+        edit = rng.choice(("drop", "swap", "replace"))
+        if edit == "drop" and len(chars) > 1:
+            del chars[i]
+        elif edit == "swap" and i + 1 < len(chars):
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+        else:
+            chars[i] = rng.choice(string.ascii_lowercase)
+    return "".join(chars)
+
+
+def percentiles(samples_ns):
+    """This function summarizes latency samples in microseconds."""
+    if not samples_ns:
+        return {}
+    ordered = sorted(samples_ns)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] / 1000
+
+    return {
+        "count": len(ordered),
+        "mean_us": sum(ordered) / len(ordered) / 1000,
+        "p50_us": pick(50),
+        "p90_us": pick(90),
+        "p99_us": pick(99),
+        "max_us": ordered[-1] / 1000,
+    }
+
+
+def time_each(fn, inputs):
+    """This function calls fn once per input and returns (latency summary, calls per second, peak bytes allocated)."""
+    inputs = list(inputs)
+    samples = []
+    started = time.perf_counter_ns()
+    for item in inputs:
+        t0 = time.perf_counter_ns()
+        fn(item)
+        samples.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter_ns() - started
+
+    # Memory is traced in a second pass so tracemalloc's overhead stays out of the latencies
+    tracemalloc.start()
+    for item in inputs:
+        fn(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    summary = percentiles(samples)
+    summary["throughput_per_s"] = len(samples) / (elapsed / 1e9) if elapsed else 0.0
+    summary["peak_memory_bytes"] = peak
+    return summary
+
+
+def bench_pipeline(queries, rounds):
+    helper = SujudAsShahwi(cache_size=0)
+    helper.index  # fit or load outside the timed stages
+    texts = [query for _, query in queries]
+    preprocessed = [helper.preprocess_text(text) for text in texts]
+    results = {}
+
+    results["preprocess_text"] = time_each(helper.preprocess_text, texts * rounds)
+    results["extract_keywords"] = time_each(helper.extract_keywords, preprocessed * rounds)
+    similarity = SimilarityTier(SIMILARITY_THRESHOLD)
+    results["similarity"] = time_each(lambda text: similarity.ranked(Query(text), helper.knowledge_base, 1), preprocessed * rounds)
+    for kind in KINDS:
+        inputs = [query for query_kind, query in queries if query_kind == kind]
+        results["search_mistake[{}]".format(kind)] = time_each(helper.search_mistake, inputs * rounds)
+    results["search_mistake[all]"] = time_each(helper.search_mistake, texts * rounds)
+
+    cached = SujudAsShahwi()
+    cached.search_many(texts)
+    results["search_mistake[cached]"] = time_each(cached.search_mistake, texts * rounds)
+
+    started = time.perf_counter()
+    helper.search_many(texts * rounds)
+    elapsed = time.perf_counter() - started
+    results["search_many"] = {"count": len(texts) * rounds, "throughput_per_s": len(texts) * rounds / elapsed}
+    return results
+
+
+def bench_accuracy(seed=42, typo_rounds=3):
+    """This function counts answers carrying the expected correction, for corpus mistakes wrapped in a
+    sentence, corpus mistakes with typos, and KNOWN_ANSWERS."""
+    helper = SujudAsShahwi(cache_size=0)
+    corrections = helper.corrections
+    rng = random.Random(seed)
+
+    def correct(query, mistake):
+        return helper.search_mistake(query).endswith("\nCorrection: " + corrections[mistake])
+
+    def summarize(cases):
+        failures = [query for query, mistake in cases if not correct(query, mistake)]
+        return {"correct": len(cases) - len(failures), "total": len(cases), "failures": failures}
+
+    mistakes = list(corrections)
+    return {
+        "wrapped": summarize([("I think I {} today".format(mistake), mistake) for mistake in mistakes]),
+        "typo": summarize([(_typo(rng, mistake), mistake) for _ in range(typo_rounds) for mistake in mistakes]),
+        "known": summarize(KNOWN_ANSWERS),
+    }
+
+
+def print_accuracy(results):
+    print("\nAccuracy")
+    for name, summary in results.items():
+        print("  {:<28} {:>4} / {:<4} {}".format(name, summary["correct"], summary["total"],
+                                                  "; ".join(summary["failures"][:5])))
+
+
+def bench_startup():
+    results = {}
+
+    def construct(_):
+        load_knowledge_base.cache_clear()
+        SujudAsShahwi()
+
+    results["construct_helper"] = time_each(construct, range(20))
+
+    from rules_payload import RulesPayload
+    rules = load_knowledge_base().rules
+    results["rules_serialization"] = time_each(lambda _: RulesPayload(rules), range(50))
+
+    # Measured as the budget check measures them, so the numbers compare with the budgets
+    for name, import_ms, budget_ms, wall_ms, heavy in startup_budget.check():
+        results["startup[{}]".format(name)] = {
+            "import_ms": import_ms, "wall_ms": wall_ms, "budget_ms": budget_ms, "heavy_modules": heavy,
+        }
+    return results
+
+
+def bench_load(queries, concurrency, requests):
+    """This function drives the Flask app with one test client per thread and reports per-route latency.
+
+    Every client thread stands for a server thread with a request in flight, so admission control lets
+    them all search at once and the latencies measure searching. Any 503 is still counted as "rejected",
+    apart from other errors, and left out of the latencies and throughput.
+    """
+    app = create_app(SujudAsShahwi(), debug=False, threads=concurrency)
+    app.extensions['search_admission'].max_concurrent = concurrency
+    local = threading.local()
+    texts = [query for _, query in queries]
+
+    def call(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        t0 = time.perf_counter_ns()
+        if i % 10 == 0:
+            route, response = "/rules", client.get("/rules")
+        else:
+            route, response = "/search", client.post("/search", json={"mistake": texts[i % len(texts)]})
+        return route, response.status_code, time.perf_counter_ns() - t0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        calls = list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    served = [(route, latency) for route, status, latency in calls if status != 503]
+    results = {"concurrency": concurrency, "requests": requests, "throughput_per_s": len(served) / elapsed,
+               "rejected": sum(1 for _, status, _ in calls if status == 503),
+               "errors": sum(1 for _, status, _ in calls if status >= 400 and status != 503)}
+    for route in sorted({route for route, _ in served}):
+        results[route] = percentiles([latency for r, latency in served if r == route])
+    return results
+
+
+def print_table(title, results):
+    print("\n{}".format(title))
+    for name, stats in results.items():
+        if isinstance(stats, dict) and "p50_us" in stats:
+            print("  {:<28} p50 {:9.1f} us  p90 {:9.1f} us  p99 {:9.1f} us  {:>10.0f}/s  peak {:>9} B".format(
+                name, stats["p50_us"], stats["p90_us"], stats["p99_us"],
+                stats.get("throughput_per_s", 0), stats.get("peak_memory_bytes", "-")))
+        else:
+            print("  {:<28} {}".format(name, json.dumps(stats)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Sujud As-Shahwi search pipeline")
+    parser.add_argument("--queries", type=int, default=400, help="Size of the synthetic query corpus")
+    parser.add_argument("--rounds", type=int, default=5, help="Times each stage replays the corpus")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--load", action="store_true", help="Also load-test the Flask app")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--accuracy", action="store_true", help="Only check answer quality, skip the timings")
+    args = parser.parse_args(argv)
+
+    if args.accuracy:
+        print_accuracy(bench_accuracy(args.seed))
+        return
+
+    queries = make_queries(args.queries, args.seed)
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "queries": args.queries,
+        "rounds": args.rounds,
+        "seed": args.seed,
+        "pipeline": bench_pipeline(queries, args.rounds),
+        "startup": bench_startup(),
+        "accuracy": bench_accuracy(args.seed),
+    }
+    if args.load:
+        report["load"] = bench_load(queries, args.concurrency, args.requests)
+
+    print_table("Pipeline", report["pipeline"])
+    print_table("Startup", report["startup"])
+    print_accuracy(report["accuracy"])
+    if args.load:
+        print_table("Load", report["load"])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Bulk classification of mistake descriptions, one per line.
+
+    python cli.py bulk archive.txt --output results.jsonl
+    cat archive.txt | python cli.py bulk - --format csv --workers 8 > results.csv
+
+Lines are sent to a process pool in chunks; every worker builds its helper and
+search index once. Results are written in input order, and only a bounded number
+of chunks is in flight at a time, so memory stays flat however long the input is.
+"""
+
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+FORMATS = ("jsonl", "csv")
+
+# Lines per task sent to a worker; large enough that pickling overhead is noise
+CHUNK_SIZE = 2000
+# Chunks queued per worker, which bounds how much input and output is held at once
+PENDING_PER_WORKER = 2
+# Seconds between progress lines on stderr
+PROGRESS_INTERVAL = 2.0
+
+_helper = None
+
+
+def _init_worker():
+    global _helper
+    import serve
+    from SujudAsShahwi import SujudAsShahwi
+    _helper = serve.warm_up(SujudAsShahwi())
+
+
+def _search_chunk(queries):
+    return _helper.search_many(queries)
+
+
+def read_queries(stream):
+    """This function yields one query per input line, keeping blank lines so output lines up with input."""
+    for line in stream:
+        yield line.rstrip("\r\n")
+
+
+def chunked(items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def classify(queries, workers=None, chunk_size=CHUNK_SIZE):
+    """This function yields (query, result) in input order, searching chunks on a pool of worker processes."""
+    if chunk_size < 1 or (workers is not None and workers < 1):
+        # A chunk size of 0 would end the input at once, silently dropping every line
+        raise ValueError("chunk_size and workers must be at least 1")
+    chunks = chunked(queries, chunk_size)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        # No pool: nothing to parallelize over, and easier to profile
+        _init_worker()
+        for chunk in chunks:
+            yield from zip(chunk, _search_chunk(chunk))
+        return
+
+    # Forked workers inherit a helper warmed here, like gunicorn's preload; spawned ones build their own
+    initializer = _init_worker
+    if multiprocessing.get_start_method() == "fork":
+        _init_worker()
+        initializer = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_search_chunk, chunk)))
+            # Wait on the oldest chunk once enough are queued, which keeps output ordered and memory bounded
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+
+
+class Progress:
+    """Reports lines processed and throughput on stderr, at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, stream=sys.stderr, interval=PROGRESS_INTERVAL):
+        self.stream = stream
+        self.interval = interval
+        self.count = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def update(self, count=1):
+        self.count += count
+        now = time.perf_counter()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed else 0.0
+        self.stream.write("{} {:,} lines in {:.1f} s ({:,.0f} lines/s)\n".format(
+            "done:" if final else "progress:", self.count, elapsed, rate))
+        self.stream.flush()
+
+
+def write_results(results, output, output_format="jsonl", progress=None):
+    """This function writes (query, result) pairs as JSON lines or CSV rows, numbering lines from 0."""
+    if output_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(["index", "mistake", "correction"])
+        write = lambda index, query, result: writer.writerow([index, query, result])
+    else:
+        write = lambda index, query, result: output.write(json.dumps(
+            {"index": index, "mistake": query, "correction": result}, ensure_ascii=False) + "\n")
+
+    for index, (query, result) in enumerate(results):
+        write(index, query, result)
+        if progress is not None:
+            progress.update()
+    if progress is not None:
+        progress.report(final=True)
+
+
+def run(source="-", destination=None, output_format="jsonl", workers=None, chunk_size=CHUNK_SIZE):
+    """This function classifies every line of source ("-" for stdin) into destination (stdout if None)."""
+    source_stream = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    # newline="" lets the csv module write its own line endings
+    output = sys.stdout if destination is None else open(destination, "w", encoding="utf-8", newline="")
+    try:
+        results = classify(read_queries(source_stream), workers, chunk_size)
+        write_results(results, output, output_format, Progress())
+    finally:
+        if source_stream is not sys.stdin:
+            source_stream.close()
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
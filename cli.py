@@ -1,21 +1,63 @@
 import argparse
-from sujud_as_shahwi import SujudAsShahwi
+
+
+def positive_int(value):
+    """This function parses an argparse option that must be a whole number of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return number
+
 
 def main():
     parser = argparse.ArgumentParser(description="Sujud As-Shahwi CLI")
-    parser.add_argument("command", choices=["search", "view"], help="Command to execute")
-    parser.add_argument("input", nargs="?", help="Input text for the search command")
+    parser.add_argument("command", choices=["search", "view", "footprint", "daemon", "bulk", "assets"], help="Command to execute")
+    parser.add_argument("input", nargs="?", help="Input text for the search command, start/stop/status for daemon, or a file for bulk (- for stdin)")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Search in this process even if a daemon is running")
+    parser.add_argument("--output", help="bulk: file to write results to (default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="bulk: output format")
+    parser.add_argument("--workers", type=positive_int, help="bulk: worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=positive_int, default=2000, help="bulk: lines sent to a worker at a time")
 
     args = parser.parse_args()
-    sujud = SujudAsShahwi()
+    if args.command == "daemon":
+        # Keeps a warm engine so repeated searches skip the start-up cost
+        import search_daemon
+        search_daemon.main([args.input or "status"])
+        return
+
+    if args.command == "bulk":
+        # Streams lines through a process pool; progress goes to stderr
+        import bulk
+        bulk.run(args.input or "-", args.output, args.format, args.workers, args.chunk_size)
+        return
+
+    if args.command == "assets":
+        # Hashed, precompressed static files for the web app, listed in static/dist/manifest.json
+        from assets import BUILD_DIR, build_assets
+        for name, hashed in build_assets().items():
+            print("{} -> {}".format(name, hashed))
+        print("manifest written to {}".format(BUILD_DIR))
+        return
+
+    if args.command == "footprint":
+        # Memory per knowledge base structure, for sizing workers
+        from footprint import print_footprint
+        print_footprint()
+        return
 
     if args.command == "search":
         if not args.input:
             print("Please provide input text for the search command.")
         else:
-            result = sujud.search_mistake(args.input)
+            # Answered by the daemon when one is running, otherwise in this process
+            import search_daemon
+            result = search_daemon.search_mistake(args.input, use_daemon=search_daemon.USE_DAEMON and not args.no_daemon)
             print(result)
     elif args.command == "view":
+        from SujudAsShahwi import SujudAsShahwi
+        sujud = SujudAsShahwi()
         rules = sujud.view_all_rules()
         for mistake, correction in rules.items():
             print(f"Mistake: {mistake}\nCorrection: {correction}\n")
@@ -1,22 +1,204 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
 
-def configure_logging():
+# Marks log lines written once per query so they can be sampled; query_extra() adds one decision for the whole query
+PER_QUERY = {"per_query": True}
+
+_pipeline = None
+_lock = threading.Lock()
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records marked per-query; every other record passes.
+
+    A record carrying `sampled` keeps the decision made for its whole query, see query_extra().
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def sample(self):
+        """This function decides whether one query's lines are kept."""
+        return self.rate >= 1 or random.random() < self.rate
+
+    def filter(self, record):
+        if not getattr(record, "per_query", False):
+            return True
+        sampled = getattr(record, "sampled", None)
+        return self.sample() if sampled is None else sampled
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records without blocking or formatting; counts records dropped when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not the caller's
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class JsonLinesFile:
+    """Appends batches of JSON lines to a file, rotating it once it grows past max_bytes."""
+
+    def __init__(self, path, max_bytes, backup_count):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.stream = open(path, "a", encoding="utf-8")
+
+    def write(self, lines):
+        self.stream.write("".join(lines))
+        self.stream.flush()
+        if self.max_bytes and self.stream.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.stream.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = "{}.{}".format(self.path, i)
+            if os.path.exists(source):
+                os.replace(source, "{}.{}".format(self.path, i + 1))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self.stream = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self.stream.close()
+
+
+def to_json_line(record):
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + ".{:03d}".format(int(record.msecs)),
+        "level": record.levelname,
+        "logger": record.name,
+        "message": record.getMessage(),
+    }
+    if record.exc_info:
+        entry["exception"] = logging.Formatter().formatException(record.exc_info)
+    return json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+class BatchingListener(threading.Thread):
+    """Drains the log queue in batches and writes each batch to the files its records are routed to."""
+
+    def __init__(self, log_queue, routes, batch_size, flush_interval, dropped=None):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.routes = routes  # [(logger name, minimum level, JsonLinesFile)]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = dropped  # returns how many records never reached the queue
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+        dropped = self.dropped() if self.dropped is not None else 0
+        if dropped:
+            # Written last, once nothing more can be dropped
+            self._write([logging.makeLogRecord({
+                "name": "error_logger", "levelno": logging.ERROR, "levelname": "ERROR",
+                "msg": "%d log records were dropped because the log queue was full", "args": (dropped,)})])
+        for _, _, target in self.routes:
+            target.close()
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        for name, level, target in self.routes:
+            lines = [to_json_line(record) for record in batch if record.name == name and record.levelno >= level]
+            if lines:
+                try:
+                    target.write(lines)
+                except OSError:
+                    pass  # a full or failing disk must not kill the writer thread
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+
+def configure_logging(log_dir=".", max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000,
+                      batch_size=256, flush_interval=0.5, sample_rate=None):
+    """This function sets up the success/error loggers once; later calls return the same loggers."""
+    global _pipeline
     success_logger = logging.getLogger('success_logger')
     error_logger = logging.getLogger('error_logger')
-    
-    success_handler = logging.FileHandler('success.log')
-    error_handler = logging.FileHandler('error.log')
-    
-    success_handler.setLevel(logging.INFO)
-    error_handler.setLevel(logging.ERROR)
-    
-    success_formatter = logging.Formatter('%(asctime)s - %(message)s')
-    error_formatter = logging.Formatter('%(asctime)s - %(message)s')
-    
-    success_handler.setFormatter(success_formatter)
-    error_handler.setFormatter(error_formatter)
-    
-    success_logger.addHandler(success_handler)
-    error_logger.addHandler(error_handler)
-    
+
+    with _lock:
+        if _pipeline is not None:
+            return success_logger, error_logger
+
+        if sample_rate is None:
+            sample_rate = float(os.environ.get("SUJUD_LOG_SAMPLE_RATE", 1.0))
+
+        # Both loggers feed one bounded queue; the listener routes each record to its logger's file
+        log_queue = queue.Queue(maxsize=queue_size)
+        handler = DroppingQueueHandler(log_queue)
+        sampler = SamplingFilter(sample_rate)
+        handler.addFilter(sampler)
+
+        success_file = JsonLinesFile(os.path.join(log_dir, 'success.log'), max_bytes, backup_count)
+        error_file = JsonLinesFile(os.path.join(log_dir, 'error.log'), max_bytes, backup_count)
+        listener = BatchingListener(log_queue, [('success_logger', logging.INFO, success_file), ('error_logger', logging.ERROR, error_file)],
+                                    batch_size, flush_interval, lambda: handler.dropped)
+        listener.start()
+        atexit.register(listener.stop)
+
+        # Scraped from /metrics in long-lived processes; short ones get the count in error.log when they exit
+        import metrics
+        metrics.register(metrics.Gauge("sujud_log_records_dropped", "Log records dropped because the log queue was full.",
+                                       dropped_records))
+
+        for logger in (success_logger, error_logger):
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            logger.propagate = False
+
+        _pipeline = (handler, listener, sampler)
+
     return success_logger, error_logger
+
+
+def query_extra():
+    """This function returns the `extra` for one query's log lines, sampled once so they are kept or dropped together."""
+    sampled = _pipeline[2].sample() if _pipeline is not None else True
+    return dict(PER_QUERY, sampled=sampled)
+
+
+def dropped_records():
+    """This function returns how many log records were dropped because the queue was full."""
+    return _pipeline[0].dropped if _pipeline is not None else 0
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Per-structure memory cost of a loaded knowledge base, for sizing workers as the corpus grows.
+
+    python cli.py footprint
+"""
+
+import gc
+import mmap
+import sys
+import types
+
+from knowledge_base import KNOWLEDGE_BASE_PATH, load_knowledge_base
+from metrics import process_memory_bytes
+
+# Shared, process-wide objects that are never charged to a structure
+_SKIPPED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+            types.CodeType, types.FrameType)
+
+
+def deep_sizeof(obj, seen):
+    """This function returns (heap bytes, memory-mapped bytes) reachable from obj, skipping objects already in seen."""
+    heap = mapped = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SKIPPED):
+            continue
+        seen.add(id(current))
+        if isinstance(current, mmap.mmap):
+            # Backed by the page cache and shared by every process mapping the same file
+            mapped += len(current)
+            continue
+        heap += sys.getsizeof(current)
+        # numpy views do not report their buffer; it is charged to the array or mapping they view
+        base = getattr(current, "base", None)
+        if base is not None and hasattr(current, "flags"):
+            stack.append(base)
+        stack.extend(gc.get_referents(current))
+    return heap, mapped
+
+
+def knowledge_base_footprint(kb):
+    """This function returns [(structure, heap bytes, mapped bytes)]; objects shared between structures count once."""
+    seen = set()
+    rows = []
+    for name in ("corrections", "normalized_keys", "keywords", "rules", "token_index", "keyword_matcher",
+                 "fuzzy_index", "suggest_index", "popularity"):
+        rows.append((name,) + deep_sizeof(getattr(kb, name), seen))
+    try:
+        index = kb.index
+    except ImportError:
+        return rows
+    rows.append(("tfidf_vectorizer",) + deep_sizeof(index.vectorizer, seen))
+    rows.append(("tfidf_matrix",) + deep_sizeof(index.matrix, seen))
+    return rows
+
+
+def print_footprint(path=KNOWLEDGE_BASE_PATH):
+    """This function loads the knowledge base and prints what each structure costs and what the process grew by."""
+    resident_before = process_memory_bytes()
+    rows = knowledge_base_footprint(load_knowledge_base(path))
+    resident_after = process_memory_bytes()
+
+    print("{:<18} {:>12} {:>14}".format("structure", "heap bytes", "mapped bytes"))
+    for name, heap, mapped in rows:
+        print("{:<18} {:>12,} {:>14,}".format(name, heap, mapped))
+    print("{:<18} {:>12,} {:>14,}".format("total", sum(row[1] for row in rows), sum(row[2] for row in rows)))
+    if resident_before is not None and resident_after is not None:
+        # Includes the libraries imported to build the structures, e.g. scikit-learn
+        print("\nresident memory {:,} bytes, {:,} of it added while loading".format(
+            resident_after, resident_after - resident_before))
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import difflib
+import sys
+from array import array
+from collections import Counter, defaultdict
+
+# Minimum scores (0-100) for a fuzzy match to count
+KEY_CUTOFF = 80
+TOKEN_CUTOFF = 65
+
+# Shortest query token worth correcting; shorter ones match too many synonyms
+MIN_TOKEN_LENGTH = 4
+
+# How many blocked candidates are scored per query
+CANDIDATE_LIMIT = 32
+
+
+def ngrams(text, n=3):
+    padded = " {} ".format(text)
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NGramIndex:
+    """Character n-gram postings used to block fuzzy candidates before any edit distance is computed.
+
+    All postings live in one array; a gram maps to its slot, and offsets[slot]:offsets[slot + 1]
+    is its run of string positions.
+    """
+
+    __slots__ = ("n", "strings", "slots", "offsets", "positions")
+
+    def __init__(self, strings, n=3):
+        self.n = n
+        self.strings = list(strings)
+        postings = defaultdict(list)
+        for position, string in enumerate(self.strings):
+            for gram in ngrams(string, n):
+                postings[gram].append(position)
+
+        self.slots = {}
+        self.offsets = array("I", [0])
+        self.positions = array("I")
+        for slot, (gram, found) in enumerate(postings.items()):
+            self.slots[sys.intern(gram)] = slot
+            self.positions.extend(found)
+            self.offsets.append(len(self.positions))
+
+    def candidates(self, text, limit=CANDIDATE_LIMIT):
+        """This function returns the strings sharing the most n-grams with the text, best first."""
+        shared = Counter()
+        for gram in ngrams(text, self.n):
+            slot = self.slots.get(gram)
+            if slot is not None:
+                shared.update(self.positions[self.offsets[slot]:self.offsets[slot + 1]])
+        return [self.strings[position] for position, _ in shared.most_common(limit)]
+
+
+def _extract_one(query, choices, cutoff):
+    try:
+        from rapidfuzz import fuzz, process
+    except ImportError:
+        scored = [(difflib.SequenceMatcher(None, query, choice).ratio() * 100, choice) for choice in choices]
+        score, choice = max(scored, default=(0.0, None))
+        return (choice, score) if score >= cutoff else (None, 0.0)
+    match = process.extractOne(query, choices, scorer=fuzz.token_sort_ratio, score_cutoff=cutoff)
+    return (match[0], match[1]) if match else (None, 0.0)
+
+
+def _closest_each(queries, choices, cutoff):
+    try:
+        from rapidfuzz import fuzz, process
+    except ImportError:
+        return [_extract_one(query, choices, cutoff)[0] for query in queries]
+    # One batched call scores every query against every candidate
+    scores = process.cdist(queries, choices, scorer=fuzz.ratio, score_cutoff=cutoff)
+    best = scores.argmax(axis=1)
+    return [choices[column] if scores[row, column] else None for row, column in enumerate(best)]
+
+
+class FuzzyIndex:
+    """Typo-tolerant lookup of corpus keys and keyword synonyms."""
+
+    __slots__ = ("keys", "synonyms", "_synonym_set")
+
+    def __init__(self, keys, synonyms):
+        self.keys = NGramIndex(keys)
+        self.synonyms = NGramIndex(synonyms)
+        self._synonym_set = frozenset(synonyms)
+
+    def best_key(self, text, cutoff=KEY_CUTOFF):
+        """This function returns the closest corpus key and its score, or (None, 0.0) below the cutoff."""
+        candidates = self.keys.candidates(text)
+        if not candidates:
+            return None, 0.0
+        return _extract_one(text, candidates, cutoff)
+
+    def correct_tokens(self, tokens, cutoff=TOKEN_CUTOFF):
+        """This function maps misspelled tokens to the keyword synonyms they most likely meant."""
+        misspelled = [token for token in tokens if len(token) >= MIN_TOKEN_LENGTH and token not in self._synonym_set]
+        candidates = list(dict.fromkeys(
+            synonym for token in misspelled for synonym in self.synonyms.candidates(token)))
+        if not misspelled or not candidates:
+            return []
+        return [synonym for synonym in _closest_each(misspelled, candidates, cutoff) if synonym is not None]
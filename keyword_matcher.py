@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import math
+import re
+import sys
+from array import array
+from collections import defaultdict
+
+from normalization import normalize_text, tokenize
+
+# Words that carry no meaning about the mistake; they weigh nothing when ranking keyword matches
+STOPWORDS = frozenset(
+    "a an the i my me you it is was in on at of to or and for with about after before during while whether "
+    "then think".split())
+# Weight of a query word no mistake contains, as much as the commonest real word: usually a typo or
+# context such as the prayer's name, which should lower a match's score without sinking it
+UNSEEN_WEIGHT = 1.0
+
+# Words for the same slip, ranked as one token so "forgot ruku" shares "missed" with "missed ruku"
+_SLIPS = {
+    "missed": ("forgot", "forget", "forgets", "forgetting", "forgotten", "miss", "misses", "missing",
+               "skip", "skipped", "skipping", "omit", "omitted", "omitting"),
+    "extra": ("add", "added", "adding", "adds", "additional"),
+    "doubt": ("doubted", "doubting", "doubts", "unsure", "uncertain"),
+}
+_CONCEPTS = {word: sys.intern(concept) for concept, words in _SLIPS.items() for word in words}
+
+
+def _concepts(tokens):
+    return [_CONCEPTS.get(token, token) for token in tokens]
+
+
+def _tokenize(mistake):
+    # A tuple costs a fraction of a frozenset and these are only ever iterated
+    return tuple(dict.fromkeys(_concepts(tokenize(mistake))))
+
+
+class KeywordMatcher:
+    """All keyword synonyms compiled into one word-bounded alternation regex."""
+
+    __slots__ = ("synonym_to_category", "pattern")
+
+    def __init__(self, keywords):
+        self.synonym_to_category = {}
+        for category, words in keywords.items():
+            for word in words:
+                # Matched against normalized text, so "sajdah" and "sujood" collapse into one synonym
+                self.synonym_to_category[sys.intern(normalize_text(word))] = category
+
+        # Longest synonyms first so "sajdah" wins over "sajda" at the same position
+        synonyms = sorted(self.synonym_to_category, key=len, reverse=True)
+        if synonyms:
+            alternation = "|".join(re.escape(word) for word in synonyms)
+            self.pattern = re.compile(r"\b({})s?\b".format(alternation))
+        else:
+            self.pattern = None
+
+    def find(self, text):
+        """This function returns every (category, start, end) match in a single pass over the text."""
+        if self.pattern is None:
+            return []
+        return [
+            (self.synonym_to_category[match.group(1)], match.start(), match.end())
+            for match in self.pattern.finditer(text)
+        ]
+
+    def categories(self, text):
+        """This function returns the matched categories in order of first appearance."""
+        return list(dict.fromkeys(category for category, _, _ in self.find(text)))
+
+
+class TokenIndex:
+    """Inverted index from a token to the positions of the mistakes containing it.
+
+    A removed mistake leaves a tombstone (None, with no tokens) at its position, so positions stay stable
+    across updates; postings only ever hold live positions.
+    """
+
+    __slots__ = ("mistakes", "tokens", "postings", "weights", "live")
+
+    def __init__(self, mistakes, tokens=None):
+        self.mistakes = list(mistakes)
+        # Deduplicated, interned tokens per mistake, by position
+        self.tokens = tokens if tokens is not None else [_tokenize(mistake) for mistake in self.mistakes]
+        postings = defaultdict(lambda: array("I"))
+        for position, mistake_tokens in enumerate(self.tokens):
+            for token in mistake_tokens:
+                postings[token].append(position)
+        self.postings = dict(postings)
+        self.live = len(self.mistakes)
+        self.weights = self._weights()
+
+    def _weights(self):
+        # Inverse document frequency, so rare words decide a match and words in every mistake barely count
+        count = self.live
+        return {token: 0.0 if token in STOPWORDS else math.log((1 + count) / (1 + len(positions))) + 1
+                for token, positions in self.postings.items()}
+
+    def updated(self, mistakes):
+        """This function returns the index for a new list of mistakes, tokenizing only the added ones.
+
+        Kept mistakes keep their positions, removed ones become tombstones and added ones are appended, so
+        only the postings of their tokens are rewritten; the others are shared with this index. Once
+        tombstones would outnumber the live mistakes, the index is rebuilt compactly from the kept tokens.
+        """
+        mistakes = list(mistakes)
+        positions = {mistake: position for position, mistake in enumerate(self.mistakes) if mistake is not None}
+        kept = set(mistakes)
+        removed = [position for mistake, position in positions.items() if mistake not in kept]
+        if len(self.mistakes) - self.live + len(removed) > len(mistakes):
+            return TokenIndex(mistakes, [self.tokens[positions[mistake]] if mistake in positions else _tokenize(mistake)
+                                         for mistake in mistakes])
+
+        index = TokenIndex.__new__(TokenIndex)
+        index.mistakes = list(self.mistakes)
+        index.tokens = list(self.tokens)
+        dropped = defaultdict(set)
+        for position in removed:
+            for token in self.tokens[position]:
+                dropped[token].add(position)
+            index.mistakes[position] = None
+            index.tokens[position] = ()
+        appended = defaultdict(lambda: array("I"))
+        for mistake in mistakes:
+            if mistake not in positions:
+                mistake_tokens = _tokenize(mistake)
+                for token in mistake_tokens:
+                    appended[token].append(len(index.mistakes))
+                index.mistakes.append(mistake)
+                index.tokens.append(mistake_tokens)
+
+        index.postings = dict(self.postings)
+        for token in set(dropped).union(appended):
+            gone = dropped.get(token, ())
+            found = array("I", (position for position in self.postings.get(token, ()) if position not in gone))
+            found.extend(appended.get(token, ()))
+            if found:
+                index.postings[token] = found
+            else:
+                del index.postings[token]
+        index.live = len(mistakes)
+        # IDF depends on the corpus size, so every weight moves; recomputing them only reads posting lengths
+        index.weights = index._weights()
+        return index
+
+    def __contains__(self, token):
+        return token in self.postings
+
+    def __getitem__(self, token):
+        return frozenset(self.mistakes[position] for position in self.postings.get(token, ()))
+
+    def _positions(self, tokens):
+        found = set()
+        for token in tokens:
+            found.update(self.postings.get(token, ()))
+        return found
+
+    def ranked(self, keywords, tokens, k=1):
+        """This function returns up to k (mistake, score) among the mistakes containing a keyword, best first.
+
+        The first keyword is taken as what the slip is about ("forgot ruku in the second rakah"), so
+        only mistakes containing it compete, unless none does.
+
+        The score, in [0, 1], is the IDF weight of the words both share over the weight of the input's
+        words plus UNSEEN_WEIGHT for each word of the mistake the input lacks. Every unmatched word costs
+        the same, so a mistake never wins because its other words are common; the earliest mistake wins ties.
+        """
+        positions = self._positions(keywords[:1]) or self._positions(keywords)
+        if not positions:
+            return []
+        tokens = set(_concepts(tokens))
+        weights = self.weights
+        query_weight = sum(weights.get(token, 0.0 if token in STOPWORDS else UNSEEN_WEIGHT) for token in tokens)
+        if not query_weight:
+            return []
+
+        def rank(position):
+            mistake_tokens = self.tokens[position]
+            shared = sum(weights[token] for token in tokens.intersection(mistake_tokens))
+            unmatched = sum(1 for token in mistake_tokens if token not in tokens and weights[token])
+            return shared / (query_weight + unmatched * UNSEEN_WEIGHT), -position
+
+        ranked = heapq.nlargest(k, map(rank, positions))
+        return [(self.mistakes[-negated], score) for score, negated in ranked]
+
+    def best_overlaps(self, texts):
+        """This function scores each text by token Jaccard overlap, a pure-Python stand-in for the TF-IDF index."""
+        best_matches, best_scores = [], []
+        for text in texts:
+            tokens = set(_concepts(text.split()))
+            best_position, best_score = None, 0.0
+            for position in self._positions(tokens):
+                mistake_tokens = self.tokens[position]
+                shared = len(tokens.intersection(mistake_tokens))
+                score = shared / (len(tokens) + len(mistake_tokens) - shared)
+                if score > best_score or (score == best_score and best_position is not None and position < best_position):
+                    best_position, best_score = position, score
+            best_matches.append(self.mistakes[best_position] if best_position is not None else None)
+            best_scores.append(best_score)
+        return best_matches, best_scores
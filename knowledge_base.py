@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import json
+import os
+import sys
+import threading
+from types import MappingProxyType
+
+from fuzzy_index import FuzzyIndex
+from keyword_matcher import KeywordMatcher, TokenIndex
+from metrics import SEARCH_STAGE_SECONDS
+from normalization import normalize_text
+from suggest_index import SuggestIndex
+from timer import TRACER
+
+# Suggestion weight of corpus terms without a popularity entry; synonyms rank below them
+DEFAULT_POPULARITY = 1.0
+SYNONYM_POPULARITY = 0.5
+
+# Next to the code, or inside the PyInstaller bundle when frozen
+DATA_DIR = os.path.join(getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__))), "data")
+KNOWLEDGE_BASE_PATH = os.environ.get("SUJUD_KNOWLEDGE_BASE", os.path.join(DATA_DIR, "knowledge_base.json"))
+
+# Seconds between checks of the knowledge base file for changes
+WATCH_INTERVAL = 2.0
+
+# Set once importing the TF-IDF index fails, so later searches go straight to the fallback
+_index_unavailable = False
+
+
+def _interned(value):
+    """This function interns every string in a JSON value, so repeated texts are stored once."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {sys.intern(key): _interned(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_interned(item) for item in value]
+    return value
+
+
+class KnowledgeBase:
+    """Mistakes, corrections, keywords and rules compiled once into read-only lookup structures."""
+
+    __slots__ = ("corrections", "normalized_keys", "token_index", "keywords", "keyword_matcher", "fuzzy_index",
+                 "suggest_index", "popularity", "rules", "_index", "_index_lock")
+
+    def __init__(self, corrections, keywords, rules, popularity=None, previous=None):
+        # Many mistakes share a correction text; interning keeps one copy of each
+        corrections = _interned(corrections)
+        mistakes = list(corrections)
+        self.corrections = MappingProxyType(corrections)
+
+        # Normalized key -> mistake as written in the corpus, for exact lookups
+        normalized_keys = {}
+        for mistake in mistakes:
+            key = sys.intern(normalize_text(mistake))
+            if normalized_keys.setdefault(key, mistake) != mistake:
+                # Only one of them could ever be found by an exact lookup
+                raise ValueError("Knowledge base mistakes {!r} and {!r} both normalize to {!r}; rename one".format(
+                    normalized_keys[key], mistake, key))
+        self.normalized_keys = MappingProxyType(normalized_keys)
+
+        # Token -> set of candidate mistakes
+        self.token_index = TokenIndex(mistakes) if previous is None else previous.token_index.updated(mistakes)
+
+        self.keywords = MappingProxyType({category: tuple(words) for category, words in _interned(keywords).items()})
+        # Every synonym compiled into one regex
+        if previous is not None and previous.keywords == self.keywords:
+            self.keyword_matcher = previous.keyword_matcher
+        else:
+            self.keyword_matcher = KeywordMatcher(self.keywords)
+
+        # Character trigram blocking over keys and synonyms for the fuzzy tier
+        self.fuzzy_index = FuzzyIndex(list(self.normalized_keys), list(self.keyword_matcher.synonym_to_category))
+
+        # Prefix completions for search-as-you-type, ranked by popularity; kept so a rebuild can rank the same way
+        popularity = _interned(popularity or {})
+        self.popularity = MappingProxyType(popularity)
+        weighted_terms = [(mistake, popularity.get(mistake, DEFAULT_POPULARITY)) for mistake in mistakes]
+        weighted_terms.extend((synonym, popularity.get(synonym, SYNONYM_POPULARITY))
+                              for synonym in self.keyword_matcher.synonym_to_category)
+        self.suggest_index = SuggestIndex(weighted_terms, normalize_text)
+
+        self.rules = _interned(rules)
+
+        # TF-IDF vectors are fitted once per corpus and cached on disk, see search_index.py
+        self._index = None
+        self._index_lock = threading.Lock()
+        if previous is not None and previous._index is not None:
+            # Reuse the fitted vectors; only added mistakes are vectorized
+            self._index = previous._index.updated(dict(self.corrections))
+
+    @property
+    def index(self):
+        """The TF-IDF search index, loaded the first time a query needs similarity scoring."""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    # Includes importing scikit-learn, so the one-off cost stays out of "similarity"
+                    with TRACER.span("index_load", SEARCH_STAGE_SECONDS):
+                        from search_index import SearchIndex
+                        self._index = SearchIndex.load_or_build(dict(self.corrections))
+        return self._index
+
+    def similarity_index(self):
+        """This function returns the TF-IDF index, or None if scikit-learn is missing; the import is tried once per process."""
+        global _index_unavailable
+        if self._index is None and _index_unavailable:
+            return None
+        try:
+            return self.index
+        except ImportError:
+            _index_unavailable = True
+            return None
+
+    def updated(self, corrections, keywords, rules, popularity=None):
+        """This function compiles the knowledge base for a changed corpus, reusing the structures the change leaves intact."""
+        return KnowledgeBase(corrections, keywords, rules, popularity, previous=self)
+
+    def lookup(self, text):
+        """This function returns the corpus mistake whose normalized key equals the normalized text, or None."""
+        return self.normalized_keys.get(normalize_text(text))
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["corrections"], data["keywords"], data["rules"], data.get("popularity")
+
+
+@functools.lru_cache(maxsize=None)
+def load_knowledge_base(path=KNOWLEDGE_BASE_PATH):
+    """This function loads and compiles the knowledge base file once per process."""
+    return KnowledgeBase(*_read(path))
+
+
+def reload_knowledge_base(previous, path=KNOWLEDGE_BASE_PATH):
+    """This function re-reads the knowledge base file and compiles it incrementally on top of the previous one."""
+    return previous.updated(*_read(path))
+
+
+class KnowledgeBaseWatcher:
+    """Polls the knowledge base file and calls on_change() whenever its modification time or size changes."""
+
+    def __init__(self, path, on_change, interval=WATCH_INTERVAL):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._signature = self._stat()
+        self._stopping = threading.Event()
+        self._pid = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def ensure_running(self):
+        """This function starts the polling thread in this process, once; forked workers start their own."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="knowledge-base-watcher", daemon=True).start()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                continue
+            self._signature = signature
+            try:
+                self.on_change()
+            except (OSError, ValueError, KeyError, TypeError):
+                # A half-written or invalid file keeps the current knowledge base serving
+                import logging
+                logging.getLogger('error_logger').exception("Reloading %s failed", self.path)
+
+    def stop(self):
+        self._stopping.set()
@@ -1,69 +1,50 @@
+import os
 import sys
 import logging
 import time
-from sujud_as_shahwi import SujudAsShahwi
-from config import configure_logging
-from timer import Timer  # Import the Timer class
+from config import configure_logging, query_extra
+from timer import TRACER
 
 # Configure logging
 success_logger, error_logger = configure_logging()
 
 def main():
     success_logger.info("Program started")
-    sujud_as_shahwi = SujudAsShahwi()
     
     if len(sys.argv) < 2:
         print("Usage: python main.py <prayer mistake description>")
         return
     
     user_input = " ".join(sys.argv[1:])
-    success_logger.info(f"User input: {user_input}")
+    # Sockets and subprocesses are only needed once there is something to search
+    import search_daemon
+    # SUJUD_TRACE_FILE=trace.json records this run's spans for chrome://tracing
+    trace_file = os.environ.get("SUJUD_TRACE_FILE")
+    if trace_file:
+        TRACER.sample_rate = 1.0
+    # One sampling decision for all of this query's lines
+    extra = query_extra()
+    success_logger.info(f"User input: {user_input}", extra=extra)
     try:
-        timer = Timer()  # Start the timer
-        print("Timer started.")
-        
-        while True:
-            command = input("Enter command (stop, reset, pause, resume, elapsed, remaining, exit): ").strip().lower()
-            
-            if command == "stop":
-                elapsed = timer.stop()
-                print(f"Timer stopped. Elapsed time: {elapsed:.2f} seconds")
-            elif command == "reset":
-                timer.reset()
-                print("Timer reset.")
-            elif command == "pause":
-                timer.pause()
-                print("Timer paused.")
-            elif command == "resume":
-                timer.resume()
-                print("Timer resumed.")
-            elif command == "elapsed":
-                elapsed = timer.get_elapsed_time()
-                print(f"Elapsed time: {elapsed:.2f} seconds")
-            elif command == "remaining":
-                duration = float(input("Enter duration in seconds: "))
-                remaining = timer.get_remaining_time(duration)
-                print(f"Remaining time: {remaining:.2f} seconds")
-            elif command == "exit":
-                print("Exiting.")
-                break
-            else:
-                print("Unknown command.")
-        
-        result = sujud_as_shahwi.search_mistake(user_input)
-        time_taken = timer.stop()  # Stop the timer and get the elapsed time
-        success_logger.info(f"Time taken for search: {time_taken:.2f} seconds")
+        # Timed on its own: no prompts inside the measured section
+        with TRACER.span("main", query_length=len(user_input)) as span:
+            # Answered by the daemon when one is running, otherwise in this process
+            result = search_daemon.search_mistake(user_input)
+        time_taken = span.duration_ns / 1e9
+        success_logger.info(f"Time taken for search: {time_taken:.4f} seconds", extra=extra)
         if result:
             print(result)
-            success_logger.info(f"Successful search for: {user_input}")
-            success_logger.info(f"Result: {result}")
+            success_logger.info(f"Successful search for: {user_input}", extra=extra)
+            success_logger.info(f"Result: {result}", extra=extra)
         else:
             print("No matching mistake found.")
-            success_logger.info(f"No matching mistake found for: {user_input}")
+            success_logger.info(f"No matching mistake found for: {user_input}", extra=extra)
     except Exception as e:
         error_logger.error(f"An error occurred: {e}")
         print(f"An error occurred: {e}")
     finally:
+        if trace_file:
+            TRACER.dump(trace_file)
         success_logger.info("Program ended")
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Low-overhead counters and latency histograms, rendered in the Prometheus text format.
+
+Each process keeps its own registry; with pre-fork servers every worker
+reports its own numbers.
+"""
+
+import bisect
+import os
+import threading
+import time
+
+# Seconds; tuned for a pipeline whose stages range from microseconds to a few milliseconds
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+_IMPORTED_AT = time.time()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    pairs.extend('{}="{}"'.format(name, _escape(value)) for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in sorted(items):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """A value read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if value is not None:
+            yield self.name, "", value
+
+
+class _Timed:
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+
+class Histogram:
+    """Cumulative latency buckets plus sum and count, one series per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        position = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[position] += 1
+            series[-1] += seconds
+
+    def time(self, *label_values):
+        """This function returns a context manager that observes the time spent inside it."""
+        return _Timed(self, label_values)
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def sum(self, *label_values):
+        series = self._series.get(label_values)
+        return series[-1] if series else 0.0
+
+    def samples(self):
+        with self._lock:
+            items = [(label_values, list(series)) for label_values, series in self._series.items()]
+        for label_values, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = (("le", _format_value(bound)),)
+                yield self.name + "_bucket", _format_labels(self.labels, label_values, le), cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield self.name + "_sum", labels, series[-1]
+            yield self.name + "_count", labels, cumulative
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render(extra=()):
+    """This function renders every registered metric, plus `extra`, in the Prometheus text format."""
+    lines = []
+    for metric in list(REGISTRY) + list(extra):
+        lines.append("# HELP {} {}".format(metric.name, metric.help))
+        lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+        for name, labels, value in metric.samples():
+            lines.append("{}{} {}".format(name, labels, _format_value(value)))
+    return "\n".join(lines) + "\n"
+
+
+def process_start_time():
+    """This function returns the process start as a Unix timestamp, or the time this module was imported."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, after the parenthesised command name which may contain spaces
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return _IMPORTED_AT
+
+
+def process_memory_bytes():
+    """This function returns the resident set size, or the peak RSS where the current one is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+SEARCH_STAGE_SECONDS = register(Histogram(
+    "sujud_search_stage_seconds", "Time spent in each search pipeline stage.", ("stage",)))
+SEARCH_ANSWERS = register(Counter(
+    "sujud_search_answers_total", "Queries answered, by the path that produced the answer.", ("path",)))
+SEARCH_ADMISSIONS = register(Counter(
+    "sujud_search_admissions_total", "Search admission decisions: admitted, queued, degraded, rejected or timed_out.",
+    ("outcome",)))
+SEARCH_TIER_QUERIES = register(Counter(
+    "sujud_search_tier_queries_total", "Queries each search tier tried, by whether it answered or passed them on.",
+    ("tier", "outcome")))
+HTTP_REQUEST_SECONDS = register(Histogram(
+    "sujud_http_request_seconds", "Time to produce an HTTP response, by route.", ("route", "method", "status")))
+
+PROCESS_START_TIME = process_start_time()
+_ready_at = None
+
+
+def mark_ready():
+    """This function records that the app finished starting, for the startup-time gauge."""
+    global _ready_at
+    _ready_at = time.time()
+
+
+register(Gauge("sujud_process_start_time_seconds", "Start time of the process since the Unix epoch.",
+               lambda: PROCESS_START_TIME))
+register(Gauge("sujud_startup_seconds", "Seconds from process start until the app was ready.",
+               lambda: _ready_at - PROCESS_START_TIME if _ready_at is not None else None))
+register(Gauge("sujud_process_resident_memory_bytes", "Resident memory of the process.", process_memory_bytes))
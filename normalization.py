@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""The one text normalization shared by indexing and querying.
+
+Every character is folded through a translate table computed once at import:
+case, Latin diacritics, Arabic diacritics and letter variants, digits and
+punctuation. Transliteration variants are then mapped to one spelling per
+word, so "sujūd", "sujood", "sajdah" and "سجود" all normalize to "sujud".
+"""
+
+import functools
+import sys
+import unicodedata
+
+# Apostrophes and ʿayn/hamza marks vanish inside words: "raka'ah" -> "rakaah", "rukū‘" -> "ruku"
+_DELETED = "'`´‘’ʼʻʾʿ" + "ـ"  # ... and the Arabic tatweel
+
+# Arabic letters with several written forms
+_ARABIC_LETTERS = {"ٱ": "ا", "ة": "ه", "ى": "ي"}
+
+# Blocks the table covers; anything else passes through unchanged
+_RANGES = (
+    (0x0000, 0x024F),  # ASCII, Latin-1, Latin Extended-A/B
+    (0x02B0, 0x036F),  # spacing modifiers, combining diacritics
+    (0x0600, 0x06FF),  # Arabic
+    (0x1E00, 0x1EFF),  # Latin Extended Additional (ḥ, ṣ, ṭ, ...)
+    (0x2000, 0x206F),  # general punctuation
+    (0xFB50, 0xFDFF),  # Arabic presentation forms A
+    (0xFE70, 0xFEFF),  # Arabic presentation forms B
+    (0xFF00, 0xFFEF),  # fullwidth forms
+)
+
+# Canonical spelling -> variants, Latin and (already folded) Arabic
+_SPELLINGS = {
+    "rakaah": ("rakah", "rakat", "rakaat", "rakats", "rakaats", "rakahs", "rakaahs", "rakka", "rakkah",
+               "ركعه", "ركعات", "ركعتين", "ركعتان"),
+    "sujud": ("sujood", "sujuud", "sujuds", "sujoods", "sajda", "sajdah", "sajdas", "sajdahs", "sajdat",
+              "سجود", "سجده", "سجدات", "سجدتين", "سجدتان"),
+    "ruku": ("rukoo", "rukuu", "rukoh", "rukus", "ركوع"),
+    "tashahhud": ("tashahud", "tashahhood", "tashahood", "تشهد"),
+    "qunut": ("qunoot", "qunuut", "قنوت"),
+    "fatiha": ("fatihah", "faatiha", "fateha", "فاتحه"),
+    "salam": ("salaam", "salams", "سلام", "تسليم"),
+    "salah": ("salaah", "salat", "salaat", "صلاه"),
+    "sahw": ("sahu", "sahwi", "shahw", "shahwi", "سهو"),
+    "takbir": ("takbeer", "تكبير", "تكبيره"),
+    "qabliyya": ("qabliyyah", "qabliya", "qabliyah", "قبليه"),
+    "baadiyya": ("baadiyyah", "badiyya", "badiyyah", "badiya", "بعديه"),
+    "witr": ("وتر",),
+    "qibla": ("qiblah", "قبله"),
+    "imam": ("امام",),
+}
+
+
+def _fold_char(char):
+    if char in _DELETED:
+        return ""
+    if char in _ARABIC_LETTERS:
+        return _ARABIC_LETTERS[char]
+    folded = []
+    for part in unicodedata.normalize("NFKD", char):
+        category = unicodedata.category(part)
+        if category == "Mn":
+            continue  # combining diacritics, including Arabic tashkeel and hamza marks
+        if part in _DELETED:
+            continue
+        if category[0] in "PSZC":
+            folded.append(" ")
+        elif category == "Nd":
+            folded.append(str(unicodedata.digit(part)))
+        else:
+            folded.append(_ARABIC_LETTERS.get(part, part.lower()))
+    return "".join(folded)
+
+
+def _build_table():
+    table = {}
+    for start, end in _RANGES:
+        for code in range(start, end + 1):
+            char = chr(code)
+            if unicodedata.category(char) == "Cs":
+                continue
+            folded = _fold_char(char)
+            if folded != char:
+                table[code] = folded
+    return table
+
+
+_TABLE = _build_table()
+
+
+def _build_variants():
+    variants = {}
+    for canonical, spellings in _SPELLINGS.items():
+        for spelling in spellings:
+            spelling = spelling.translate(_TABLE)
+            variants[spelling] = canonical
+            if not spelling.isascii():
+                variants["ال" + spelling] = canonical  # with the definite article
+    return variants
+
+
+_VARIANTS = _build_variants()
+
+
+# Longest text memoized; queries are untrusted, and a handful of huge ones must not pin megabytes
+MAX_CACHED_LENGTH = 256
+
+
+def _normalize(text):
+    words = text.translate(_TABLE).split()
+    return " ".join([_VARIANTS.get(word, word) for word in words])
+
+
+_normalize_cached = functools.lru_cache(maxsize=16384)(_normalize)
+
+
+def normalize_text(text):
+    """This function folds case, diacritics, punctuation, Arabic letter forms and transliteration variants."""
+    return _normalize_cached(text) if len(text) <= MAX_CACHED_LENGTH else _normalize(text)
+
+
+def tokenize(text):
+    """This function returns the interned words of the normalized text."""
+    return tuple(sys.intern(word) for word in normalize_text(text).split())
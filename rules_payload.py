@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import hashlib
+import html
+import json
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+RULES_CACHE_CONTROL = "public, max-age=3600"
+
+
+def render_rules_html(rules):
+    """This function renders the rules the same way formatRules in scripts.js used to, escaping the text."""
+    parts = ["<h2>Rules</h2>"]
+    for section, content in rules.items():
+        parts.append("<h3>{}</h3>".format(html.escape(section)))
+        if isinstance(content, dict):
+            for sub_section, details in content.items():
+                parts.append("<h4>{}</h4>".format(html.escape(sub_section)))
+                parts.append(_render_items(details))
+        else:
+            parts.append(_render_items(content))
+    return "".join(parts)
+
+
+def _render_items(content):
+    if isinstance(content, list):
+        return "<ul>{}</ul>".format("".join("<li>{}</li>".format(html.escape(item)) for item in content))
+    return "<p>{}</p>".format(html.escape(content))
+
+
+def accepted_encodings(header):
+    """This function returns the content codings the client accepts, honouring q=0."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class EncodedBody:
+    """One representation encoded once, with identity, gzip and (if available) brotli variants."""
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.tag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body)
+
+    def etag(self, encoding):
+        # Strong validators must differ between encodings of the same content
+        return self.tag if encoding == "identity" else "{}-{}".format(self.tag, encoding)
+
+    def choose(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+    def response(self, req):
+        """This function answers the request with the best variant, or 304 if the client copy is current."""
+        from flask import Response
+
+        encoding = self.choose(req.headers.get("Accept-Encoding"))
+        headers = {
+            "ETag": '"{}"'.format(self.etag(encoding)),
+            "Cache-Control": RULES_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if any(req.if_none_match.contains_weak(self.etag(other)) for other in self.variants):
+            return Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
+
+
+class RulesPayload:
+    """The rules serialized once as JSON and as an HTML fragment, ready to send."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        body = json.dumps(rules, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.json = EncodedBody(body, "application/json")
+        self.html = EncodedBody(render_rules_html(rules).encode("utf-8"), "text/html")
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""The search cascade: tiers tried cheapest first, stopping at the first confident answer.
+
+    exact       the normalized query is a corpus key                  dict lookup
+    keyword     mistakes sharing a keyword, by weighted token overlap  inverted index
+    similarity  TF-IDF cosine against every mistake                    sparse product
+    fuzzy       typo-tolerant match of the keys, then of the keywords  n-gram blocking + edit distance
+
+Every tier has its own threshold and passes a query on when its best score is
+below it, so most traffic is answered by the first two tiers in microseconds.
+SUJUD_SEARCH_TIERS picks and orders the tiers (e.g. "exact,keyword,fuzzy") and
+SUJUD_<TIER>_THRESHOLD overrides a threshold.
+"""
+
+import os
+
+from fuzzy_index import KEY_CUTOFF
+from metrics import SEARCH_STAGE_SECONDS, SEARCH_TIER_QUERIES
+from timer import TRACER
+
+# Minimum scores, in [0, 1], for a tier to answer
+KEYWORD_THRESHOLD = 0.35
+# A keyword ranking whose runner-up scores within this of the best is a tie
+KEYWORD_TIE_MARGIN = 0.01
+# Key similarity, in [0, 1], at which a misspelled key settles a keyword tie
+NEAR_EXACT_THRESHOLD = 0.9
+SIMILARITY_THRESHOLD = 0.3
+FUZZY_THRESHOLD = KEY_CUTOFF / 100
+
+# Tiers that cost microseconds whatever the corpus size, used when searches degrade under load
+CHEAP_TIERS = ("exact", "keyword")
+
+
+class Query:
+    """One normalized query, with what the tiers derive from it computed at most once."""
+
+    __slots__ = ("text", "tokens", "_categories")
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = text.split()
+        self._categories = None
+
+    def categories(self, kb):
+        """This function returns the keyword categories found in the query, in order of first appearance."""
+        if self._categories is None:
+            with TRACER.span("extract_keywords", SEARCH_STAGE_SECONDS):
+                self._categories = kb.keyword_matcher.categories(self.text)
+        return self._categories
+
+
+class Tier:
+    """One strategy of the cascade, ranking candidates for a query and answering when the best is confident."""
+
+    name = None
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def confident(self, ranked):
+        return bool(ranked) and ranked[0][1] >= self.threshold
+
+    def prepare(self, kb):
+        """This function does one-off work such as loading an index, kept out of the tier's timings."""
+
+    def ranked_many(self, queries, kb, k):
+        return [self.ranked(query, kb, k) for query in queries]
+
+    def ranked(self, query, kb, k):
+        """This function returns up to k (mistake, score), best first, whatever their confidence."""
+        raise NotImplementedError
+
+
+class ExactTier(Tier):
+    name = "exact"
+
+    def ranked(self, query, kb, k):
+        mistake = kb.normalized_keys.get(query.text)
+        return [(mistake, 1.0)] if mistake is not None else []
+
+
+class KeywordTier(Tier):
+    """Ranks the mistakes sharing a keyword by weighted token overlap.
+
+    A tie at the top would go to the earliest entry, so it is settled by a near-exact key match when
+    there is one: "dubting rakaat" ties "doubting rakaat" with "extra rakaah" on tokens alone. A tie at
+    a perfect score has every word of each tied mistake in the query, so it is no typo and is kept.
+    """
+
+    name = "keyword"
+
+    def __init__(self, threshold, tie_margin=KEYWORD_TIE_MARGIN, near_exact=NEAR_EXACT_THRESHOLD):
+        super().__init__(threshold)
+        self.tie_margin = tie_margin
+        self.near_exact = near_exact
+
+    def ranked(self, query, kb, k):
+        categories = query.categories(kb)
+        if not categories:
+            return []
+        # The runner-up is needed to tell a tie from a clear answer
+        ranked = kb.token_index.ranked(categories, query.tokens, max(k, 2))
+        if len(ranked) > 1 and ranked[0][1] < 1.0 and ranked[0][1] - ranked[1][1] <= self.tie_margin:
+            key, score = kb.fuzzy_index.best_key(query.text, self.near_exact * 100)
+            if key is not None:
+                mistake = kb.normalized_keys[key]
+                ranked = [(mistake, score / 100)] + [candidate for candidate in ranked if candidate[0] != mistake]
+        return ranked[:k]
+
+
+class SimilarityTier(Tier):
+    name = "similarity"
+
+    def prepare(self, kb):
+        kb.similarity_index()
+
+    def ranked_many(self, queries, kb, k):
+        texts = [query.text for query in queries]
+        index = kb.similarity_index()
+        if index is None:
+            # scikit-learn is not installed, fall back to pure-Python token overlap, which ranks only the best
+            best_matches, best_scores = kb.token_index.best_overlaps(texts)
+            return [[(mistake, score)] if mistake is not None else [] for mistake, score in zip(best_matches, best_scores)]
+        # One sparse product for the whole batch
+        return index.top_matches(texts, k)
+
+    def ranked(self, query, kb, k):
+        return self.ranked_many([query], kb, k)[0]
+
+
+class FuzzyTier(Tier):
+    """Matches a misspelled key; failing that, corrects misspelled keywords and ranks as the keyword tier does.
+
+    The threshold applies to the key's string similarity; the corrected-keyword ranking uses keyword_threshold.
+    Only candidates past their threshold are ranked, so any candidate is confident.
+    """
+
+    name = "fuzzy"
+
+    def __init__(self, threshold, keyword_threshold=KEYWORD_THRESHOLD):
+        super().__init__(threshold)
+        self.keyword_threshold = keyword_threshold
+
+    def confident(self, ranked):
+        return bool(ranked)
+
+    def ranked(self, query, kb, k):
+        fuzzy_index = kb.fuzzy_index
+        key, score = fuzzy_index.best_key(query.text, self.threshold * 100)
+        if key is not None:
+            return [(kb.normalized_keys[key], score / 100)]
+
+        # Otherwise correct misspelled keywords ("rukoo" -> "ruku") and retry the keyword ranking
+        synonyms = fuzzy_index.correct_tokens(query.tokens)
+        categories = list(dict.fromkeys(kb.keyword_matcher.synonym_to_category[synonym] for synonym in synonyms))
+        if not categories:
+            return []
+        ranked = kb.token_index.ranked(categories, query.tokens + synonyms, k)
+        return [(mistake, score) for mistake, score in ranked if score >= self.keyword_threshold]
+
+
+TIERS = {tier.name: tier for tier in (ExactTier, KeywordTier, SimilarityTier, FuzzyTier)}
+DEFAULT_THRESHOLDS = {"exact": 1.0, "keyword": KEYWORD_THRESHOLD, "similarity": SIMILARITY_THRESHOLD,
+                      "fuzzy": FUZZY_THRESHOLD}
+
+
+class SearchCascade:
+    """Runs queries through the tiers in order; each query stops at the first tier that answers it."""
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+
+    @classmethod
+    def build(cls, names=tuple(TIERS), thresholds=None):
+        """This function builds a cascade of the named tiers, with DEFAULT_THRESHOLDS unless overridden."""
+        thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        unknown = [name for name in names if name not in TIERS]
+        if unknown:
+            raise ValueError("Unknown search tiers: {} (known: {})".format(", ".join(unknown), ", ".join(TIERS)))
+        tiers = []
+        for name in names:
+            if name == "fuzzy":
+                tiers.append(FuzzyTier(thresholds["fuzzy"], thresholds["keyword"]))
+            else:
+                tiers.append(TIERS[name](thresholds[name]))
+        return cls(tiers)
+
+    @classmethod
+    def from_env(cls):
+        """This function builds the cascade configured by SUJUD_SEARCH_TIERS and SUJUD_<TIER>_THRESHOLD."""
+        names = os.environ.get("SUJUD_SEARCH_TIERS")
+        names = [name.strip() for name in names.split(",") if name.strip()] if names else list(TIERS)
+        thresholds = {name: float(os.environ["SUJUD_{}_THRESHOLD".format(name.upper())])
+                      for name in TIERS if "SUJUD_{}_THRESHOLD".format(name.upper()) in os.environ}
+        return cls.build(names, thresholds)
+
+    def run(self, queries, kb, only=None, k=1):
+        """This function returns (tier name, up to k (mistake, score) best first) per query, in one pass.
+
+        The first candidate is the answer; a query no tier answers gets (None, []). `only` restricts
+        the run to the named tiers, in cascade order.
+        """
+        answers = [(None, [])] * len(queries)
+        pending = list(range(len(queries)))
+        for tier in self.tiers:
+            if not pending:
+                break
+            if only is not None and tier.name not in only:
+                continue
+            # A first query must not charge the index load to the tier's cost
+            tier.prepare(kb)
+            with TRACER.span(tier.name, SEARCH_STAGE_SECONDS):
+                rankings = tier.ranked_many([queries[position] for position in pending], kb, k)
+            unanswered = []
+            for position, ranked in zip(pending, rankings):
+                if tier.confident(ranked):
+                    answers[position] = (tier.name, ranked)
+                else:
+                    unanswered.append(position)
+            SEARCH_TIER_QUERIES.inc(tier.name, "answered", amount=len(pending) - len(unanswered))
+            SEARCH_TIER_QUERIES.inc(tier.name, "passed", amount=len(unanswered))
+            pending = unanswered
+        return answers
+
+    def stats(self):
+        """This function returns, per tier, the queries it tried, how many it answered and the time it took."""
+        stats = {}
+        for tier in self.tiers:
+            answered = SEARCH_TIER_QUERIES.value(tier.name, "answered")
+            tried = answered + SEARCH_TIER_QUERIES.value(tier.name, "passed")
+            seconds = SEARCH_STAGE_SECONDS.sum(tier.name)
+            stats[tier.name] = {
+                "threshold": tier.threshold,
+                "queries": tried,
+                "answered": answered,
+                "answer_rate": answered / tried if tried else 0.0,
+                "seconds": seconds,
+                "mean_us_per_query": seconds / tried * 1e6 if tried else 0.0,
+            }
+        return stats
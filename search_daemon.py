@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""A background process that keeps a warm helper and answers searches over a Unix socket.
+
+    python cli.py daemon start      # fork a daemon and wait until it answers
+    python cli.py daemon status
+    python cli.py daemon stop
+    python search_daemon.py run            # stay in the foreground, e.g. under systemd
+
+While it runs, `cli.py search` and `main.py` send their query to it instead of
+loading the knowledge base and search index themselves. It exits on its own
+after SUJUD_DAEMON_IDLE_TIMEOUT seconds without a request.
+
+The socket lives in a directory only its user can enter: $XDG_RUNTIME_DIR, or
+a 0700 sujud-<uid> directory in the temp dir (SUJUD_SOCKET overrides it). A
+client only talks to a socket owned by its own user, so nobody else can
+answer its searches.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+
+def _default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "sujud.sock")
+    user = os.getuid() if hasattr(os, "getuid") else "user"
+    return os.path.join(tempfile.gettempdir(), "sujud-{}".format(user), "sujud.sock")
+
+
+SOCKET_PATH = os.environ.get("SUJUD_SOCKET") or _default_socket_path()
+IDLE_TIMEOUT = float(os.environ.get("SUJUD_DAEMON_IDLE_TIMEOUT", 600))
+# Set SUJUD_NO_DAEMON to always search in-process
+USE_DAEMON = not os.environ.get("SUJUD_NO_DAEMON")
+
+# Seconds a client waits for an answer before searching in-process instead
+CLIENT_TIMEOUT = 5.0
+# Seconds `start` waits for a new daemon to come up
+START_TIMEOUT = 30.0
+# Seconds between idle checks
+POLL_INTERVAL = 1.0
+
+
+def supported():
+    return hasattr(socket, "AF_UNIX")
+
+
+def _owned(path):
+    """This function tells whether path exists and belongs to the current user."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return not hasattr(os, "getuid") or st.st_uid == os.getuid()
+
+
+def _private_directory(directory):
+    """This function creates the socket's directory if needed, and refuses one that other users could write to."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        raise SystemExit("{} must be a directory owned by you that other users cannot write to".format(directory))
+
+
+def request(message, socket_path=SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+    """This function sends one message to the daemon and returns its reply, or None if no daemon answers.
+
+    A socket owned by another user is ignored, whoever listens on it.
+    """
+    if not supported() or not _owned(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+            with client.makefile("rb") as replies:
+                line = replies.readline()
+    except OSError:
+        return None
+    return json.loads(line) if line else None
+
+
+def search_mistake(user_input, socket_path=SOCKET_PATH, use_daemon=USE_DAEMON):
+    """This function asks the daemon when one is running and searches in-process otherwise."""
+    reply = request({"op": "search", "mistake": user_input}, socket_path) if use_daemon else None
+    if reply is not None and "correction" in reply:
+        return reply["correction"]
+    from SujudAsShahwi import SujudAsShahwi
+    return SujudAsShahwi().search_mistake(user_input)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            self.server.touch()
+            try:
+                message = json.loads(line)
+                reply = self.server.dispatch(message)
+            except (ValueError, AttributeError, TypeError) as e:
+                reply = {"error": "Bad request: {}".format(e)}
+            self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+# Windows builds without AF_UNIX never construct the server, see supported()
+_UnixStreamServer = getattr(socketserver, "UnixStreamServer", socketserver.TCPServer)
+
+
+class DaemonServer(socketserver.ThreadingMixIn, _UnixStreamServer):
+    """Serves search, status and stop requests for one warm helper until stopped or idle."""
+
+    daemon_threads = True
+    timeout = POLL_INTERVAL
+
+    def __init__(self, socket_path, helper, idle_timeout=IDLE_TIMEOUT):
+        self.helper = helper
+        self.idle_timeout = idle_timeout
+        self.started = time.time()
+        self.requests = 0
+        self._last_request = time.monotonic()
+        self._stopping = threading.Event()
+        # Owner-only socket: queries never leave this user
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def touch(self):
+        self.requests += 1
+        self._last_request = time.monotonic()
+
+    def dispatch(self, message):
+        op = message.get("op")
+        if op == "search":
+            return {"correction": self.helper.search_mistake(message.get("mistake", ""))}
+        if op == "status":
+            return {
+                "pid": os.getpid(),
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "idle_timeout_seconds": self.idle_timeout,
+                "mistakes": len(self.helper.corrections),
+                "cache": self.helper.cache.stats(),
+            }
+        if op == "stop":
+            self._stopping.set()
+            return {"stopping": True}
+        return {"error": "Unknown op: {}".format(op)}
+
+    def idle(self):
+        return self.idle_timeout > 0 and time.monotonic() - self._last_request > self.idle_timeout
+
+    def run(self):
+        try:
+            while not self._stopping.is_set() and not self.idle():
+                self.handle_request()
+        finally:
+            self.server_close()
+            try:
+                os.remove(self.server_address)
+            except OSError:
+                pass
+
+
+def run(socket_path=SOCKET_PATH, idle_timeout=IDLE_TIMEOUT):
+    """This function warms a helper and serves it on the socket in the foreground."""
+    if not supported():
+        raise SystemExit("Unix domain sockets are not available on this platform")
+    _private_directory(os.path.dirname(os.path.abspath(socket_path)))
+    if request({"op": "status"}, socket_path) is not None:
+        raise SystemExit("A daemon is already listening on {}".format(socket_path))
+    if os.path.lexists(socket_path):
+        if not _owned(socket_path):
+            raise SystemExit("{} belongs to another user; remove it or set SUJUD_SOCKET".format(socket_path))
+        os.remove(socket_path)  # left behind by a daemon that did not exit cleanly
+
+    import serve
+    from SujudAsShahwi import SujudAsShahwi
+    from knowledge_base import KNOWLEDGE_BASE_PATH, KnowledgeBaseWatcher
+
+    helper = serve.warm_up(SujudAsShahwi())
+    # A long-lived daemon picks up corpus edits like a web worker does
+    watcher = KnowledgeBaseWatcher(KNOWLEDGE_BASE_PATH, helper.reload)
+    watcher.ensure_running()
+    DaemonServer(socket_path, helper, idle_timeout).run()
+    watcher.stop()
+
+
+def start(socket_path=SOCKET_PATH, idle_timeout=IDLE_TIMEOUT):
+    """This function launches a detached daemon and returns its status once it answers."""
+    info = request({"op": "status"}, socket_path)
+    if info is not None:
+        return info
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "run", "--socket", socket_path, "--idle-timeout", str(idle_timeout)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        info = request({"op": "status"}, socket_path)
+        if info is not None:
+            return info
+    return None
+
+
+def stop(socket_path=SOCKET_PATH):
+    """This function asks the daemon to exit; False if none was running."""
+    return request({"op": "stop"}, socket_path) is not None
+
+
+def status(socket_path=SOCKET_PATH):
+    return request({"op": "status"}, socket_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sujud As-Shahwi search daemon")
+    parser.add_argument("action", choices=["start", "stop", "status", "run"])
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path (default: %(default)s)")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="Exit after this many seconds without a request; 0 never exits (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.action == "run":
+        run(args.socket, args.idle_timeout)
+    elif args.action == "start":
+        info = start(args.socket, args.idle_timeout)
+        if info is None:
+            raise SystemExit("The daemon did not start within {:.0f} seconds".format(START_TIMEOUT))
+        print("Daemon running, pid {} on {}".format(info["pid"], args.socket))
+    elif args.action == "stop":
+        print("Daemon stopped." if stop(args.socket) else "No daemon is running.")
+    else:
+        info = status(args.socket)
+        if info is None:
+            print("No daemon is running.")
+            sys.exit(1)
+        print(json.dumps(info, indent=2))
+
+
+if __name__ == "__main__":
+    main()
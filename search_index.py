@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from normalization import normalize_text
+
+# Where fitted indexes are cached between runs; override with SUJUD_INDEX_DIR.
+INDEX_DIR = os.environ.get(
+    "SUJUD_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".index_cache"),
+)
+INDEX_VERSION = 3
+
+# The matrix is stored as float32 values and int32 column indices/row pointers, back to back
+_ARRAY_TYPES = (np.float32, np.int32, np.int32)
+
+
+def corpus_hash(corrections):
+    """This function returns a stable hash of the corrections corpus."""
+    payload = json.dumps(corrections, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _compact(matrix):
+    matrix = matrix.tocsr()
+    arrays = [array.astype(dtype, copy=False) for array, dtype in zip((matrix.data, matrix.indices, matrix.indptr), _ARRAY_TYPES)]
+    return sparse.csr_matrix(tuple(arrays), shape=matrix.shape, copy=False)
+
+
+def _map_matrix(path, shape, nnz):
+    """This function maps the saved matrix read-only, so every process using the file shares its pages."""
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays, offset = [], 0
+    for dtype, count in zip(_ARRAY_TYPES, (nnz, nnz, shape[0] + 1)):
+        size = count * np.dtype(dtype).itemsize
+        arrays.append(buffer[offset:offset + size].view(dtype))
+        offset += size
+    if offset != len(buffer):
+        raise ValueError("{} does not match its header".format(path))
+    return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def _write_atomically(path, chunks):
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+class SearchIndex:
+    """TF-IDF index over the mistake texts, fitted once and reused for every query."""
+
+    __slots__ = ("mistakes", "vectorizer", "matrix", "digest")
+
+    def __init__(self, mistakes, vectorizer, matrix, digest):
+        self.mistakes = mistakes
+        self.vectorizer = vectorizer
+        self.matrix = _compact(matrix)  # L2-normalized float32 CSR matrix, one row per mistake
+        self.digest = digest
+
+    @classmethod
+    def build(cls, corrections):
+        """This function fits a fresh index over the corrections corpus."""
+        mistakes = list(corrections.keys())
+        vectorizer = TfidfVectorizer(dtype=np.float32)
+        # Fitted on the same normalization queries get before they are scored
+        matrix = vectorizer.fit_transform([normalize_text(mistake) for mistake in mistakes])
+        return cls(mistakes, vectorizer, matrix, corpus_hash(corrections))
+
+    @classmethod
+    def load_or_build(cls, corrections, index_dir=INDEX_DIR):
+        """This function maps the cached index for this corpus, fitting and saving it if missing."""
+        digest = corpus_hash(corrections)
+        path = os.path.join(index_dir, "tfidf-v{}-{}.pkl".format(INDEX_VERSION, digest[:16]))
+        try:
+            index = cls.load(path)
+            if index.digest == digest:
+                return index
+        except (OSError, EOFError, AttributeError, ValueError, TypeError, pickle.UnpicklingError):
+            pass
+
+        index = cls.build(corrections)
+        index.save(path)
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """This function reads the pickled vectorizer and maps the matrix saved next to it."""
+        with open(path, "rb") as f:
+            mistakes, vectorizer, shape, nnz, digest = pickle.load(f)
+        # The same words appear as tokens in the keyword index; share one copy
+        vectorizer.vocabulary_ = {sys.intern(term): column for term, column in vectorizer.vocabulary_.items()}
+        index = cls.__new__(cls)
+        index.mistakes = [sys.intern(mistake) for mistake in mistakes]
+        index.vectorizer = vectorizer
+        index.matrix = _map_matrix(os.path.splitext(path)[0] + ".bin", shape, nnz)
+        index.digest = digest
+        return index
+
+    def updated(self, corrections):
+        """This function returns an index over a changed corpus, reusing the rows of kept mistakes and
+        vectorizing added ones with the already fitted vocabulary instead of refitting."""
+        mistakes = list(corrections.keys())
+        rows = {mistake: row for row, mistake in enumerate(self.mistakes)}
+        added = [mistake for mistake in mistakes if mistake not in rows]
+        matrix = self.matrix
+        if added:
+            rows.update((mistake, len(self.mistakes) + i) for i, mistake in enumerate(added))
+            matrix = sparse.vstack([matrix, self.vectorizer.transform([normalize_text(mistake) for mistake in added])], format="csr")
+        # Not saved: a cold start refits on the new corpus, picking up any words the vocabulary is missing
+        return SearchIndex(mistakes, self.vectorizer, matrix[[rows[mistake] for mistake in mistakes]], corpus_hash(corrections))
+
+    def save(self, path):
+        """This function writes the matrix, then the header pointing at it, each atomically so concurrent workers never read a partial file."""
+        matrix = self.matrix
+        header = pickle.dumps((self.mistakes, self.vectorizer, matrix.shape, matrix.nnz, self.digest),
+                              protocol=pickle.HIGHEST_PROTOCOL)
+        # A read-only deployment still works, it just refits on every start.
+        if _write_atomically(os.path.splitext(path)[0] + ".bin",
+                             (array.tobytes() for array in (matrix.data, matrix.indices, matrix.indptr))):
+            _write_atomically(path, (header,))
+
+    def top_matches(self, texts, k):
+        """This function returns up to k (mistake, score) per text, best first, from one sparse product.
+
+        Rows are partitioned instead of fully sorted; k=1 is a plain argmax. Zero scores are left out.
+        """
+        if not self.mistakes or not texts or k <= 0:
+            return [[] for _ in texts]
+        # Rows are already L2-normalized, so the dot product is the cosine similarity
+        scores = (self.vectorizer.transform(texts) @ self.matrix.T).toarray()
+        if k == 1:
+            top = scores.argmax(axis=1)[:, None]
+        else:
+            top = np.argpartition(scores, -k, axis=1)[:, -k:] if k < scores.shape[1] else np.argsort(-scores, axis=1)
+            rows = np.arange(len(texts))[:, None]
+            top = np.take_along_axis(top, np.argsort(-scores[rows, top], axis=1, kind="stable"), axis=1)
+        return [[(self.mistakes[idx], float(row[idx])) for idx in columns if row[idx] > 0]
+                for row, columns in zip(scores, top)]
@@ -0,0 +1,118 @@
+"""Production entry point for the web app.
+
+    python serve.py --engine waitress --threads 8
+    python serve.py --engine gunicorn --workers 4 --threads 2
+    python serve.py --engine asgi --threads 8
+
+The helper and its search index are built once in this process before any
+worker is forked, so gunicorn workers share that memory copy-on-write.
+"""
+
+import argparse
+import gc
+import multiprocessing
+import os
+
+from SujudAsShahwi import SujudAsShahwi, create_app
+
+ENGINES = ("waitress", "gunicorn", "asgi")
+
+
+def warm_up(helper):
+    """This function loads the helper's search index now rather than on the first request."""
+    try:
+        helper.index
+    except ImportError:
+        pass  # scikit-learn missing, the helper falls back to token overlap
+    return helper
+
+
+def build_app(helper=None, threads=None):
+    """This function builds the helper, warms its search index and returns the production Flask app."""
+    helper = helper if helper is not None else SujudAsShahwi()
+    return create_app(warm_up(helper), debug=False, threads=threads)
+
+
+def run_waitress(app, options):
+    from waitress import serve
+
+    serve(app, host=options.host, port=options.port, threads=options.threads)
+
+
+def run_gunicorn(app, options):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("gunicorn is not installed (it does not run on Windows); use --engine waitress")
+
+    class StandaloneApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", "{}:{}".format(options.host, options.port))
+            self.cfg.set("workers", options.workers)
+            self.cfg.set("threads", options.threads)
+            self.cfg.set("worker_class", "gthread" if options.threads > 1 else "sync")
+            self.cfg.set("preload_app", True)
+            self.cfg.set("timeout", options.timeout)
+
+        def load(self):
+            return app
+
+    StandaloneApplication().run()
+
+
+def run_asgi(app, options):
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("uvicorn is not installed; pip install uvicorn to use --engine asgi")
+    from async_app import AsyncSearchApp
+
+    # Everything except the search API is served by the Flask app, when asgiref can adapt it
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+        fallback = WsgiToAsgi(app)
+    except ImportError:
+        fallback = None
+
+    admission = app.extensions['search_admission']
+    # Waiting searches hold no thread here, so the queue can be longer than with waitress or gunicorn
+    asgi_app = AsyncSearchApp(app.extensions['sujood_helper'], max_workers=options.threads, fallback=fallback,
+                              max_queue=int(os.environ.get("SUJUD_SEARCH_QUEUE", options.threads * 4)),
+                              queue_timeout=admission.queue_timeout, degrade=admission.degrade)
+    uvicorn.run(asgi_app, host=options.host, port=options.port, lifespan="on")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Sujud As-Shahwi web app")
+    parser.add_argument("--engine", choices=ENGINES, default=os.environ.get("SUJUD_ENGINE", "waitress"),
+                        help="waitress (threads, one process), gunicorn (pre-fork workers) "
+                             "or asgi (uvicorn event loop, coalesced /search)")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count())),
+                        help="Worker processes (gunicorn only)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("SUJUD_THREADS", 4)),
+                        help="Threads per process (search executor size for asgi)")
+    parser.add_argument("--timeout", type=int, default=30, help="Worker timeout in seconds (gunicorn only)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, app=None):
+    options = parse_args(argv)
+    if app is None:
+        app = build_app(threads=options.threads)
+
+    # Move everything built so far out of the collector's reach so workers don't dirty the shared pages
+    gc.freeze()
+
+    if options.engine == "gunicorn":
+        run_gunicorn(app, options)
+    elif options.engine == "asgi":
+        run_asgi(app, options)
+    else:
+        run_waitress(app, options)
+
+
+if __name__ == "__main__":
+    main()
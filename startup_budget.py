@@ -0,0 +1,115 @@
+"""Cold-start budget check.
+
+Runs each scenario in a fresh interpreter under `python -X importtime` and
+fails (exit code 1) if its imports take longer than the budget or pull in any
+of the heavy ML/web modules that should only load on first use.
+
+    python startup_budget.py
+    python -m unittest startup_budget      # the same checks as a test
+
+The heavy-module check is exact. Import times are noisy, so each scenario keeps
+the fastest of REPEATS runs and is charged only for what it imports beyond a
+bare interpreter; the budgets leave about twice the cost measured on a one-CPU
+machine (37-48 ms), so they catch a creeping import, not scheduler jitter.
+"""
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Top-level packages that must not be imported on the fast paths
+HEAVY_MODULES = ("sklearn", "scipy", "numpy", "joblib", "fuzzywuzzy", "rapidfuzz", "flask", "werkzeug", "waitress")
+
+# Runs per scenario; noise only ever adds time, so the fastest is kept
+REPEATS = 3
+# What every interpreter imports before running anything, subtracted from the scenarios
+BASELINE = ["-c", "pass"]
+
+# name -> (interpreter arguments, import budget in milliseconds beyond the baseline)
+SCENARIOS = {
+    "cli view": (["cli.py", "view"], 100),
+    "exact search": (["-c", "import SujudAsShahwi; SujudAsShahwi.SujudAsShahwi().search_mistake('missed sujud')"], 100),
+    "keyword search": (["-c", "import SujudAsShahwi; SujudAsShahwi.SujudAsShahwi().search_mistake('I forgot a sajda')"], 100),
+}
+
+
+def measure(args, repeats=1):
+    """This function runs the interpreter with -X importtime and returns (import ms, wall ms, heavy modules seen).
+
+    With repeats, the times are the fastest of that many runs.
+    """
+    runs = [_measure_once(args) for _ in range(repeats)]
+    return (min(import_ms for import_ms, _, _ in runs), min(wall_ms for _, wall_ms, _ in runs),
+            sorted(set().union(*(heavy for _, _, heavy in runs))))
+
+
+def _measure_once(args):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        cwd=HERE, capture_output=True, text=True, encoding="utf-8",
+        # Measure the in-process path even if a search daemon is running
+        env=dict(os.environ, SUJUD_NO_DAEMON="1"),
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError("{} failed:\n{}".format(" ".join(args), proc.stderr))
+
+    import_us = 0
+    heavy = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            import_us += int(fields[0])
+        except ValueError:
+            continue  # the column header line
+        package = fields[2].strip().split(".")[0]
+        if package in HEAVY_MODULES:
+            heavy.add(package)
+    return import_us / 1000, wall_ms, sorted(heavy)
+
+
+def check():
+    """This function measures every scenario and returns [(name, own import ms, budget ms, wall ms, heavy modules)]."""
+    baseline_ms = measure(BASELINE, REPEATS)[0]
+    results = []
+    for name, (args, budget_ms) in SCENARIOS.items():
+        import_ms, wall_ms, heavy = measure(args, REPEATS)
+        results.append((name, import_ms - baseline_ms, budget_ms, wall_ms, heavy))
+    return results
+
+
+class StartupBudgetTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = check()
+
+    def test_no_heavy_modules(self):
+        for name, _, _, _, heavy in self.results:
+            self.assertEqual(heavy, [], name)
+
+    def test_import_budget(self):
+        for name, import_ms, budget_ms, _, _ in self.results:
+            self.assertLessEqual(import_ms, budget_ms, name)
+
+
+def main():
+    failed = False
+    for name, import_ms, budget_ms, wall_ms, heavy in check():
+        ok = import_ms <= budget_ms and not heavy
+        failed = failed or not ok
+        print("{:<16} imports {:7.1f} ms (budget {} ms)  wall {:7.1f} ms  {}".format(
+            name, import_ms, budget_ms, wall_ms, "ok" if ok else "OVER BUDGET"))
+        if heavy:
+            print("    heavy modules imported: {}".format(", ".join(heavy)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,69 @@
 document.addEventListener('DOMContentLoaded', function() {
+    // The server renders the rules once; use the copy inlined in the page, or fetch them once and reuse them
+    const inlinedRules = document.getElementById('rules-html');
+    let rulesHtml = inlinedRules ? Promise.resolve(inlinedRules.innerHTML) : null;
+
     document.getElementById('view-rules').addEventListener('click', function() {
-        fetch('/rules')
-            .then(response => response.json())
-            .then(data => {
-                let output = formatRules(data);
-                document.getElementById('result').innerHTML = output;
+        if (!rulesHtml) {
+            rulesHtml = fetch('/rules/html').then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to load rules');
+                }
+                return response.text();
+            });
+        }
+        rulesHtml.then(html => {
+            document.getElementById('result').innerHTML = html;
+        })
+        .catch(() => {
+            // Fetch again on the next click
+            rulesHtml = null;
+            document.getElementById('result').innerText = 'Could not load the rules. Please try again.';
+        });
+    });
+
+    // Suggestions while typing: wait for a pause, and abort the request a newer keystroke made stale
+    const SUGGEST_DELAY_MS = 150;
+    const input = document.getElementById('mistake-input');
+    const suggestions = document.getElementById('mistake-suggestions');
+    let suggestTimer = null;
+    let suggestRequest = null;
+
+    function showSuggestions(items) {
+        suggestions.replaceChildren(...items.map(item => {
+            const option = document.createElement('option');
+            option.value = item;
+            return option;
+        }));
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(suggestTimer);
+        if (suggestRequest) {
+            suggestRequest.abort();
+            suggestRequest = null;
+        }
+        const prefix = input.value.trim();
+        if (!prefix) {
+            showSuggestions([]);
+            return;
+        }
+        suggestTimer = setTimeout(function() {
+            const request = suggestRequest = new AbortController();
+            fetch('/suggest?q=' + encodeURIComponent(prefix), { signal: request.signal })
+            .then(response => response.ok ? response.json() : [])
+            .then(showSuggestions)
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    showSuggestions([]);
+                }
+            })
+            .finally(() => {
+                if (suggestRequest === request) {
+                    suggestRequest = null;
+                }
             });
+        }, SUGGEST_DELAY_MS);
     });
 
     document.getElementById('search-mistake').addEventListener('click', function() {
@@ -19,53 +77,11 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => response.json())
         .then(data => {
-            document.getElementById('result').innerText = data.correction;
+            // An overloaded server answers 503 with an error message instead of a correction
+            document.getElementById('result').innerText = data.correction || data.error;
+        })
+        .catch(() => {
+            document.getElementById('result').innerText = 'Search failed. Please try again.';
         });
     });
 });
-
-function formatRules(rules) {
-    const order = [
-        "When to Perform Sujood As-Sahw",
-        "When Sujood As-Sahw Expires",
-        "Following the Imam in Forgetfulness",
-        "Correcting Missed Actions",
-        "Forgetfulness in Shaf’ and Witr",
-        "More Rules on Forgetfulness",
-        "Conclusion"
-    ];
-
-    let html = '<h2>Rules</h2>';
-    order.forEach(section => {
-        if (rules[section]) {
-            html += `<h3>${section}</h3>`;
-            let content = rules[section];
-            if (typeof content === 'object') {
-                if (Array.isArray(content)) {
-                    html += '<ul>';
-                    content.forEach(item => {
-                        html += `<li>${item}</li>`;
-                    });
-                    html += '</ul>';
-                } else {
-                    for (let subSection in content) {
-                        html += `<h4>${subSection}</h4>`;
-                        let details = content[subSection];
-                        if (Array.isArray(details)) {
-                            html += '<ul>';
-                            details.forEach(detail => {
-                                html += `<li>${detail}</li>`;
-                            });
-                            html += '</ul>';
-                        } else {
-                            html += `<p>${details}</p>`;
-                        }
-                    }
-                }
-            } else {
-                html += `<p>${content}</p>`;
-            }
-        }
-    });
-    return html;
-}
\ No newline at end of file
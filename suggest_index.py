@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import heapq
+from array import array
+from bisect import bisect_left
+
+SUGGEST_LIMIT = 8
+
+
+class SuggestIndex:
+    """Sorted array of every word-start suffix of the terms, searched with bisect for prefix completions."""
+
+    __slots__ = ("normalize", "displays", "weights", "keys", "entries", "suggest")
+
+    def __init__(self, weighted_terms, normalize):
+        self.normalize = normalize
+        self.displays = []
+        self.weights = array("d")
+        rows = []
+        for entry, (display, weight) in enumerate(weighted_terms):
+            self.displays.append(display)
+            self.weights.append(weight)
+            words = normalize(display).split()
+            # "missed sujud" is found by typing "mis" or "suj"
+            for start in range(len(words)):
+                rows.append((" ".join(words[start:]), entry))
+        rows.sort()
+        # Parallel arrays: the sorted suffixes, and the term each one completes to
+        self.keys = [key for key, _ in rows]
+        self.entries = array("I", (entry for _, entry in rows))
+        self.suggest = functools.lru_cache(maxsize=4096)(self._suggest)
+
+    def _rank(self, entry):
+        # Most popular first, then shortest
+        display = self.displays[entry]
+        return -self.weights[entry], len(display), display
+
+    def _suggest(self, prefix, limit=SUGGEST_LIMIT):
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return ()
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + "\uffff", low)
+
+        # One term can match at several word starts
+        entries = set(self.entries[low:high])
+        return tuple(self.displays[entry] for entry in heapq.nsmallest(limit, entries, key=self._rank))
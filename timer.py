@@ -1,24 +1,47 @@
+"""Monotonic timing: the simple `Timer`, and a span tracer for the search pipeline.
+
+    with TRACER.span("search_mistake", query_length=len(text)) as span:
+        ...
+        span.set("tier", "exact")
+
+    @TRACER.traced()
+    def search_many(...): ...
+
+Spans nest within a thread or async task. Whether a trace is recorded is
+decided once, by its outermost span, at SUJUD_TRACE_SAMPLE_RATE. Recorded
+traces can be exported as Chrome trace-event JSON and opened in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
 import time
+from collections import deque
+
 
 class Timer:
     def __init__(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
 
     def stop(self):
-        return time.time() - self.start_time
+        return time.perf_counter() - self.start_time
 
     def reset(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
 
     def get_elapsed_time(self):
-        return time.time() - self.start_time
+        return time.perf_counter() - self.start_time
 
     def pause(self):
-        self.paused_time = time.time()
+        self.paused_time = time.perf_counter()
         self.is_paused_flag = True
 
     def resume(self):
-        self.start_time += time.time() - self.paused_time
+        self.start_time += time.perf_counter() - self.paused_time
         self.is_paused_flag = False
 
     def is_paused(self):
@@ -31,3 +54,136 @@ class Timer:
         if self.is_paused():
             return max(0, duration - (self.paused_time - self.start_time))
         return max(0, duration - self.get_elapsed_time())
+
+
+# How many sampled traces are kept for export
+MAX_TRACES = 1000
+# Spans kept per trace, so a long streamed /search/batch cannot grow its trace without bound
+MAX_TRACE_EVENTS = 10000
+
+# The trace the current thread or task is inside: a _Trace, _UNSAMPLED, or None outside any span
+_current = contextvars.ContextVar("sujud_trace", default=None)
+_UNSAMPLED = object()
+
+
+class _Trace:
+    __slots__ = ("events", "stack", "dropped")
+
+    def __init__(self):
+        self.events = []  # (name, start ns, duration ns, thread id, attributes), in completion order
+        self.stack = []
+        self.dropped = 0
+
+    @property
+    def duration_ns(self):
+        return self.events[-1][2] if self.events else 0
+
+
+class Span:
+    """One timed section. Always feeds its histogram; recorded only when its trace is sampled."""
+
+    __slots__ = ("tracer", "name", "attributes", "histogram", "start", "duration_ns", "_trace", "_token")
+
+    def __init__(self, tracer, name, histogram=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.histogram = histogram
+        self.attributes = attributes or {}
+
+    def set(self, key, value):
+        self.attributes[key] = value
+        return self
+
+    def __enter__(self):
+        trace = _current.get()
+        self._token = None
+        if trace is None:
+            # Outermost span: decide for the whole trace
+            trace = _Trace() if self.tracer.sampled() else _UNSAMPLED
+            self._token = _current.set(trace)
+        if trace is not _UNSAMPLED:
+            trace.stack.append(self)
+        self._trace = trace
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration_ns = duration = time.perf_counter_ns() - self.start
+        if self.histogram is not None:
+            self.histogram.observe(duration / 1e9, self.name)
+        trace = self._trace
+        if trace is not _UNSAMPLED:
+            trace.stack.pop()
+            if self._token is not None:
+                # The outermost span is always kept: it closes the trace and carries its duration
+                if trace.dropped:
+                    self.attributes["dropped_spans"] = trace.dropped
+                trace.events.append((self.name, self.start, duration, threading.get_ident(), self.attributes))
+            elif len(trace.events) < self.tracer.max_events:
+                trace.events.append((self.name, self.start, duration, threading.get_ident(), self.attributes))
+            else:
+                trace.dropped += 1
+        if self._token is not None:
+            _current.reset(self._token)
+            if trace is not _UNSAMPLED:
+                self.tracer.traces.append(trace)
+        return False
+
+
+class Tracer:
+    """Creates spans, samples traces and keeps the most recent sampled ones."""
+
+    def __init__(self, sample_rate=0.0, max_traces=MAX_TRACES, max_events=MAX_TRACE_EVENTS):
+        self.sample_rate = sample_rate
+        self.max_events = max_events
+        self.traces = deque(maxlen=max_traces)
+        self.epoch_ns = time.perf_counter_ns()
+
+    def sampled(self):
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def span(self, name, histogram=None, **attributes):
+        """This function returns a span context manager; with a histogram, its duration is also observed under its name."""
+        return Span(self, name, histogram, attributes)
+
+    def traced(self, name=None, histogram=None):
+        """This function returns a decorator that runs every call of the function inside a span."""
+        def decorate(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with Span(self, span_name, histogram):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def annotate(self, **attributes):
+        """This function adds attributes to the innermost open span, if the current trace is sampled."""
+        trace = _current.get()
+        if isinstance(trace, _Trace) and trace.stack:
+            trace.stack[-1].attributes.update(attributes)
+
+    def chrome_trace(self, min_duration_ms=0.0):
+        """This function returns the kept traces lasting at least min_duration_ms as Chrome trace events."""
+        pid = os.getpid()
+        events = []
+        for trace in list(self.traces):
+            if trace.duration_ns < min_duration_ms * 1e6:
+                continue
+            for name, start, duration, thread_id, attributes in trace.events:
+                events.append({
+                    "name": name, "cat": "sujud", "ph": "X", "pid": pid, "tid": thread_id,
+                    "ts": (start - self.epoch_ns) / 1000, "dur": duration / 1000,
+                    "args": {key: value if isinstance(value, (int, float, str, bool)) else str(value)
+                             for key, value in attributes.items()},
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path, min_duration_ms=0.0):
+        """This function writes the Chrome trace JSON to path."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(min_duration_ms), f, ensure_ascii=False)
+
+
+TRACER = Tracer(sample_rate=float(os.environ.get("SUJUD_TRACE_SAMPLE_RATE", 0.0)))